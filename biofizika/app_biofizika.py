@@ -1,8 +1,11 @@
 from __future__ import annotations
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple
 from pathlib import Path
 import csv, io, json, os, re
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from xml.sax.saxutils import escape
 import streamlit as st
 
 # ─────────────────────────────────────────────────────────
@@ -19,15 +22,61 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT, TA_JUSTIFY
 from reportlab.lib.units import cm
-from reportlab.lib import utils
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from PIL import Image as PILImage
+
+try:
+    import orjson
+except ImportError:  # opcionális gyorsítás; nélküle a stdlib json-t használjuk
+    orjson = None
 
 # ─────────────────────────────────────────────────────────
 # Alapmappák + robusztus útvonalkeresés (CSV-k a biofizika/app mappában)
 APP_DIR: Path = Path(__file__).resolve().parent  # a biofizika/ app mappa
 
 
+def _first_existing_path(candidates: List[Path], want_dir: bool = False) -> Path:
+    """
+    Az első létező kandidátus (duplikátumok – pl. CWD == APP_DIR – egyszer stat-olva).
+    Ha nincs találat, FileNotFoundError(próbált_útvonalak) – így a hiány nem kerül cache-be.
+    """
+    tried: List[Path] = []
+    for p in candidates:
+        if p in tried:
+            continue
+        tried.append(p)
+        if p.is_dir() if want_dir else p.exists():
+            return p
+    raise FileNotFoundError(tried)
+
+
+# A találat folyamat-szinten cache-elt (kulcs: név, env-érték, CWD), a rerunok nem stat-olnak.
+@st.cache_resource(show_spinner=False)
+def _locate_file(filename: str, env_path: Optional[str], cwd: str) -> Path:
+    candidates: List[Path] = []
+    # 1) környezeti változó
+    if env_path:
+        candidates.append(Path(env_path).expanduser().resolve())
+    # 2–6) kandidátok sorban
+    candidates += [
+        APP_DIR / filename,
+        Path(cwd) / filename,
+        APP_DIR.parent / filename,
+        APP_DIR / "data" / filename,
+        Path(cwd) / "biofizika" / filename,
+    ]
+    return _first_existing_path(candidates)
+
+
+@st.cache_resource(show_spinner=False)
+def _locate_dir(dirname: str, cwd: str) -> Path:
+    return _first_existing_path(
+        [APP_DIR / dirname, Path(cwd) / dirname, APP_DIR.parent / dirname],
+        want_dir=True,
+    )
+
+
 def _resolve_file(filename: str, env_var: Optional[str] = None) -> Path:
     """
     Robusztus fájlkeresés:
@@ -39,30 +88,11 @@ def _resolve_file(filename: str, env_var: Optional[str] = None) -> Path:
     6) CWD 'biofizika/' almappája (Path.cwd() / 'biofizika')
     Első találatot adja vissza; ha semmi nincs, APP_DIR/filename-re esik vissza.
     """
-    tried: list[Path] = []
-
-    # 1) környezeti változó
-    if env_var:
-        p_env = os.getenv(env_var)
-        if p_env:
-            p = Path(p_env).expanduser().resolve()
-            tried.append(p)
-            if p.exists():
-                return p
-
-    # 2–6) kandidátok sorban
-    candidates = [
-        APP_DIR / filename,
-        Path.cwd() / filename,
-        APP_DIR.parent / filename,
-        APP_DIR / "data" / filename,
-        Path.cwd() / "biofizika" / filename,
-    ]
-
-    for p in candidates:
-        tried.append(p)
-        if p.exists():
-            return p
+    env_path = os.getenv(env_var) if env_var else None
+    try:
+        return _locate_file(filename, env_path, str(Path.cwd()))
+    except FileNotFoundError as e:
+        tried = e.args[0]
 
     # nincs találat → barátságos üzenet + fallback az APP_DIR-re
     st.warning(
@@ -80,15 +110,10 @@ def _resolve_dir(dirname: str) -> Path:
     3) APP_DIR.parent/dirname
     Ha egyik sem létezik, az APP_DIR/dirname-et adja vissza (létrehozás nélkül).
     """
-    candidates = [
-        APP_DIR / dirname,
-        Path.cwd() / dirname,
-        APP_DIR.parent / dirname,
-    ]
-    for p in candidates:
-        if p.exists() and p.is_dir():
-            return p
-    return APP_DIR / dirname
+    try:
+        return _locate_dir(dirname, str(Path.cwd()))
+    except FileNotFoundError:
+        return APP_DIR / dirname
 
 
 # CSV-k: maradnak a biofizika/app mappában
@@ -120,31 +145,71 @@ if _show_paths:
 
 # ─────────────────────────────────────────────────────────
 # Segédfüggvények – CSV
-def detect_dialect(path: Path) -> Optional[csv.Dialect]:
+class BiofizikaDialect(csv.Dialect):
+    """Az app CSV-inek ismert formátuma: vessző + opcionális szóköz ("question, answer")."""
+
+    delimiter = ","
+    quotechar = '"'
+    doublequote = True
+    skipinitialspace = True
+    lineterminator = "\r\n"
+    quoting = csv.QUOTE_MINIMAL
+
+
+csv.register_dialect("biofiz", BiofizikaDialect)
+
+
+# Előre fordított minták: qid ('x.xx') a kérdésben, témaszám a subject-sor elején
+_QID_RE = re.compile(r"\b(\d+\.\d+)\b")
+_THEME_NUM_RE = re.compile(r"\s*(\d+)")
+
+
+def _file_key(path: Path) -> Tuple[str, int, int]:
+    """Cache-kulcs egy fájlhoz: (útvonal, mtime_ns, méret) – új fájlverziónál új kulcs."""
+    stat = path.stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+def _dir_key(path: Path) -> Tuple[str, int]:
+    """Cache-kulcs egy könyvtárhoz: (útvonal, mtime_ns); hiányzó könyvtárnál mtime = 0."""
     try:
-        with open(path, "r", encoding="utf-8-sig") as f:
+        return str(path), path.stat().st_mtime_ns
+    except OSError:
+        return str(path), 0
+
+
+@functools.lru_cache(maxsize=8)
+def _sniff_dialect(path_str: str, mtime_ns: int, size: int) -> Optional[csv.Dialect]:
+    try:
+        with open(path_str, "r", encoding="utf-8-sig", newline="") as f:
             sample = f.read(4096)
             return csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
     except Exception:
         return None
 
 
-def first_existing(d: Dict[str, str], *cands: str) -> Optional[str]:
-    lm = {k.strip().lower(): k for k in d.keys()}
+def _header_lookup(header: Sequence[str], *cands: str) -> Optional[int]:
+    """Az első illeszkedő oszlopnév indexe a fejlécben (kis-/nagybetű- és szóköz-független)."""
+    lm = {h.strip().lower(): i for i, h in enumerate(header) if h}
     for c in cands:
         if c in lm:
             return lm[c]
     return None
 
 
+def _qa_column_indices(header: List[str]) -> Tuple[Optional[int], Optional[int]]:
+    """A fejlécsorból a kérdés- és válaszoszlop indexe (None, ha nem található)."""
+    q_idx = _header_lookup(header, "question", "kérdés", "kerdes", "q")
+    a_idx = _header_lookup(header, "answer", "válasz", "valasz", "a")
+    return q_idx, a_idx
+
+
 def extract_qid(question: str) -> Optional[str]:
     """x.xx formátumú sorszám kinyerése a kérdésből"""
     if not question:
         return None
-    m = re.search(r"\b(\d+\.\d+)\b", question)
-    if m:
-        return m.group(1)
-    return None
+    m = _QID_RE.search(question)
+    return m.group(1) if m else None
 
 
 def split_answers(cell: Optional[str]) -> List[str]:
@@ -153,73 +218,74 @@ def split_answers(cell: Optional[str]) -> List[str]:
     s = cell.strip()
     if not s:
         return []
-    # több sor → soronként válasz
-    if "\n" in s:
-        return [x.strip() for x in s.split("\n") if x.strip()]
-    # pontosvesszővel elválasztott
-    if ";" in s:
-        return [x.strip() for x in s.split(";") if x.strip()]
-    return [s]
+    # több sor → soronként válasz; különben pontosvesszővel elválasztott
+    sep = "\n" if "\n" in s else ";" if ";" in s else None
+    if sep is None:
+        return [s]
+    return [p for x in s.split(sep) if (p := x.strip())]
 
 
 # ─────────────────────────────────────────────────────────
-# subject.csv betöltése
-def load_subjects(path: Path) -> List[str]:
-    if not path.exists():
-        st.error(f"Hiányzik: {path}")
-        st.stop()
-    dialect = detect_dialect(path)
-    with open(path, "r", encoding="utf-8-sig") as f:
-        rows = list(csv.reader(f, dialect=dialect) if dialect else csv.reader(f))
-    subjects = []
-    for row in rows:
-        if row and row[0].strip():
-            subjects.append(row[0].strip())
-    return subjects
+# subject.csv betöltése (a cache-t a _warmup adja, fájlverziónként egyszer fut)
+def _load_subjects(path_str: str) -> List[str]:
+    with open(path_str, "r", encoding="utf-8-sig", newline="") as f:
+        return [
+            subj
+            for row in csv.reader(f, dialect="biofiz")
+            if row and (subj := row[0].strip())
+        ]
 
 
 # ─────────────────────────────────────────────────────────
 # kérdések betöltése az elméleti CSV-ből
-def load_questions(
-    path: Path, theme_number: str
-) -> Tuple[List[str], Dict[str, List[str]], Dict[str, str]]:
+ThemeQuestions = Tuple[List[str], Dict[str, List[str]], Dict[str, str]]
+
+
+class MissingColumnsError(Exception):
+    """Az elméleti CSV fejlécéből hiányzik a 'question' és/vagy 'answer' oszlop."""
+
+
+def _load_all_questions_indexed(
+    path_str: str, mtime_ns: int, size: int
+) -> Dict[str, ThemeQuestions]:
     """
-    Visszaad:
-    questions : lista a megjelenítendő kérdésekből (szűrve témára)
-    answers_map : { kérdés: [válaszok] }
-    qid_map : { kérdés: qid ('x.xx') }
+    Egyetlen menetben beolvassa a teljes CSV-t, és témaszám szerint csoportosít:
+    { témaszám: (questions, qa_map, qid_map) } – a qid ('x.xx') pont előtti része a téma.
     """
-    dialect = detect_dialect(path)
-    with open(path, "r", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f, dialect=dialect) if dialect else csv.DictReader(f)
-        rows = list(reader)
-    if not rows:
-        return [], {}, {}
-    q_col = first_existing(rows[0], "question", "kérdés", "kerdes", "q")
-    a_col = first_existing(rows[0], "answer", "válasz", "valasz", "a")
-    if not q_col or not a_col:
-        st.error(
-            "Az elmeleti_kerdes_valaszok.csv-ben hiányzik a 'question' és/vagy 'answer' oszlop."
-        )
-        st.stop()
-    qa_map: Dict[str, List[str]] = {}
-    qid_map: Dict[str, str] = {}
-    question_list: List[str] = []
-    for r in rows:
-        q = (r.get(q_col, "") or "").strip()
-        a_raw = r.get(a_col, "") or ""
-        if not q:
-            continue
-        qid = extract_qid(q)
-        if not qid:
-            continue
-        # Téma szerinti szűrés → x.xx -> első számjegy(ek)
-        if not qid.startswith(theme_number + "."):
-            continue
-        qa_map[q] = split_answers(a_raw)
-        qid_map[q] = qid
-        question_list.append(q)
-    return question_list, qa_map, qid_map
+    by_theme: Dict[str, ThemeQuestions] = {}
+    with open(path_str, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, dialect="biofiz")
+        q_idx, a_idx = _qa_column_indices(next(reader, []))
+        if q_idx is None or a_idx is None:
+            # Fallback (pl. env-ből megadott, ';'-vel tagolt fájl): dialektus-sniffelés
+            sniffed = _sniff_dialect(path_str, mtime_ns, size)
+            if sniffed:
+                f.seek(0)
+                reader = csv.reader(f, dialect=sniffed)
+                q_idx, a_idx = _qa_column_indices(next(reader, []))
+        if q_idx is None or a_idx is None:
+            if size == 0:
+                return {}
+            raise MissingColumnsError("question/answer")
+
+        for row in reader:
+            n = len(row)
+            q = row[q_idx].strip() if q_idx < n else ""
+            a_raw = row[a_idx] if a_idx < n else ""
+            if not q:
+                continue
+            qid = extract_qid(q)
+            if not qid:
+                continue
+            # Téma szerinti csoportosítás → x.xx -> első számjegy(ek)
+            theme = qid.split(".", 1)[0]
+            if theme not in by_theme:
+                by_theme[theme] = ([], {}, {})
+            question_list, qa_map, qid_map = by_theme[theme]
+            qa_map[q] = split_answers(a_raw)
+            qid_map[q] = qid
+            question_list.append(q)
+    return by_theme
 
 
 # ─────────────────────────────────────────────────────────
@@ -227,39 +293,62 @@ def load_questions(
 IMG_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
 
 
+@st.cache_resource(show_spinner=False)
+def _build_image_index(dir_str: str, mtime_ns: int) -> Dict[str, List[Path]]:
+    """
+    Egyetlen os.scandir a képkönyvtáron → { qid: [képek név szerint rendezve] }.
+    - pontos egyezés: qid.ext → kulcs: qid
+    - több kép: qid_*.ext → kulcs: az első '_' előtti rész
+    A könyvtár mtime-ja a kulcs része, így fájl hozzáadása/törlése új indexet ad.
+    """
+    index: Dict[str, List[Path]] = {}
+    try:
+        with os.scandir(dir_str) as it:
+            for entry in it:
+                name = entry.name
+                # olcsó névszűrés előbb, a stat csak a képjelölteknél fut
+                if not name.endswith(IMG_EXTS) or not entry.is_file():
+                    continue
+                qid = name.rsplit(".", 1)[0].split("_", 1)[0]
+                index.setdefault(qid, []).append(Path(entry.path))
+    except OSError:
+        return {}
+    for paths in index.values():
+        paths.sort(key=lambda x: x.name.lower())
+    return index
+
+
 def find_answer_images(qid: str) -> List[Path]:
     """Visszaadja az összes képet, amely a qid-hez tartozik:
     - pontos egyezés: qid.png/jpg/jpeg/webp/gif
     - több kép: qid_*.png/jpg/jpeg/webp/gif
     """
-    out: List[Path] = []
-    # pontos egyezés
-    for ext in IMG_EXTS:
-        p = PIC_A_DIR / f"{qid}{ext}"
-        if p.exists():
-            out.append(p)
-    # több kép: qid_*.ext
-    for ext in IMG_EXTS:
-        for p in PIC_A_DIR.glob(f"{qid}_*{ext}"):
-            out.append(p)
-    return sorted(out, key=lambda x: x.name.lower())
+    return _build_image_index(*_dir_key(PIC_A_DIR)).get(qid, [])
 
 
 # ─────────────────────────────────────────────────────────
 # PDF segédek + magyar font regisztrálása
+def _register_ttf(name: str, path: Path) -> None:
+    """TTF regisztrálása, ha még nincs a ReportLab registry-ben (a fájl parse-olása drága)."""
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(name, str(path)))
+
+
+@functools.cache
 def register_hungarian_font() -> Tuple[str, str, bool]:
     """
     Visszaad: (regular_font_name, bold_font_name, is_unicode_ready)
     Ha megtalálja a DejaVu Sans TTF-eket az app mappában, azokat regisztrálja.
     Különben Helvetica-ra esik vissza (ami nem biztos, hogy tartalmazza az ű/ő/í karaktereket PDF-ben).
+    Folyamatonként egyszer fut le, a rerunok a memoizált eredményt kapják.
     """
     regular = APP_DIR / "DejaVuSans.ttf"
     bold = APP_DIR / "DejaVuSans-Bold.ttf"
     try:
         if regular.exists():
-            pdfmetrics.registerFont(TTFont("DejaVuSans", str(regular)))
+            _register_ttf("DejaVuSans", regular)
             if bold.exists():
-                pdfmetrics.registerFont(TTFont("DejaVuSans-Bold", str(bold)))
+                _register_ttf("DejaVuSans-Bold", bold)
                 return "DejaVuSans", "DejaVuSans-Bold", True
             else:
                 return "DejaVuSans", "DejaVuSans", True
@@ -269,11 +358,33 @@ def register_hungarian_font() -> Tuple[str, str, bool]:
         return "Helvetica", "Helvetica-Bold", False
 
 
+@functools.lru_cache(maxsize=512)
+def _img_size(path_str: str, mtime_ns: int) -> Tuple[int, int]:
+    """Képméret (px) csak a fejlécből olvasva; (útvonal, mtime) szerint memoizálva."""
+    with PILImage.open(path_str) as im:
+        return im.size
+
+
+def _prefetch_image_sizes(paths: List[Path]) -> None:
+    """Képfejlécek párhuzamos előolvasása (I/O-kötött) – a _img_size cache-t tölti fel."""
+
+    def _warm(p: Path) -> None:
+        try:
+            _img_size(str(p), p.stat().st_mtime_ns)
+        except Exception:
+            pass
+
+    if not paths:
+        return
+    workers = min(32, (os.cpu_count() or 1) * 4, len(paths))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(_warm, paths))
+
+
 def _rl_img_scaled(path: Path, max_width: float) -> Optional[RLImage]:
     """Kép beolvasása és méretezése a megadott max szélességre (arányt tartva)."""
     try:
-        img_reader = utils.ImageReader(str(path))
-        iw, ih = img_reader.getSize()
+        iw, ih = _img_size(str(path), path.stat().st_mtime_ns)
         if iw == 0 or ih == 0:
             return None
         scale = min(1.0, max_width / float(iw))
@@ -284,48 +395,27 @@ def _rl_img_scaled(path: Path, max_width: float) -> Optional[RLImage]:
         return None
 
 
-# ─────────────────────────────────────────────────────────
-# KLASSZIKUS FLOW + felső magassági korlát
-# - képek teljes hasznos szélességre skálázva (_rl_img_scaled)
-# - nincs KeepInFrame, nincs automatikus oldaltörés
-# - HA túl magas lenne a kép: lekorlátozzuk egy felső határra (hasznos oldal-magasság X%-a)
-def build_pdf(
-    theme_label: str,
-    theme_number: str,
-    questions: List[str],
-    qa_map: Dict[str, List[str]],
-    qid_map: Dict[str, str],
-    font_reg: str,
-    font_bold: str,
-) -> bytes:
-    """PDF építése: 1 témához minden kérdés + válaszok + képek, A4, egységes tipó.
-    Kérések szerint: nincs kérdésfejléc és nincs 'Elfogadható válasz(ok):', a megoldás sorkizárt.
-    """
-    buf = BytesIO()
-    # Dokumentum
-    MARG = 2 * cm
-    doc = SimpleDocTemplate(
-        buf,
-        pagesize=A4,
-        leftMargin=MARG,
-        rightMargin=MARG,
-        topMargin=MARG,
-        bottomMargin=MARG,
-    )
-    width, height = A4
-    usable_w = width - 2 * MARG
-    usable_h = height - 2 * MARG
-    # felső magassági korlát: a hasznos oldal magasságának 70%-a
-    MAX_IMG_H_FRAC = 0.70
-    max_img_h = usable_h * MAX_IMG_H_FRAC
+@functools.lru_cache(maxsize=4096)
+def _para_markup(text: str) -> str:
+    """Nyers szöveg → ReportLab Paragraph-markup: &, <, > escape-elve, sortörés → <br/>."""
+    return escape(text).replace("\n", "<br/>")
 
-    # Stílusok
+
+@functools.cache
+def _get_styles(font_reg: str, font_bold: str) -> Dict[str, ParagraphStyle]:
+    """PDF stílusok (cím, téma-fejléc, kérdés, válasz, meta) – mindkét PDF-builder ezeket használja."""
     styles = getSampleStyleSheet()
     style_title = styles["Title"]
     style_title.fontName = font_bold
     style_title.fontSize = 18
     style_title.spaceAfter = 12
 
+    style_h1 = styles["Heading1"]
+    style_h1.fontName = font_bold
+    style_h1.fontSize = 16
+    style_h1.spaceBefore = 14
+    style_h1.spaceAfter = 8
+
     # KÉRDÉS: félkövér (bold), nagyobb méret, jobb elkülönítés
     style_q = ParagraphStyle(
         name="Question",
@@ -356,13 +446,68 @@ def build_pdf(
         textColor="#666",
         spaceAfter=6,
     )
+    return {
+        "title": style_title,
+        "h1": style_h1,
+        "q": style_q,
+        "ans": style_ans,
+        "meta": style_meta,
+    }
+
+
+# ─────────────────────────────────────────────────────────
+# KLASSZIKUS FLOW + felső magassági korlát
+# - képek teljes hasznos szélességre skálázva (_rl_img_scaled)
+# - nincs KeepInFrame, nincs automatikus oldaltörés
+# - HA túl magas lenne a kép: lekorlátozzuk egy felső határra (hasznos oldal-magasság X%-a)
+def build_pdf(
+    theme_label: str,
+    theme_number: str,
+    questions: List[str],
+    qa_map: Dict[str, List[str]],
+    qid_map: Dict[str, str],
+    font_reg: str,
+    font_bold: str,
+) -> bytes:
+    """PDF építése: 1 témához minden kérdés + válaszok + képek, A4, egységes tipó.
+    Kérések szerint: nincs kérdésfejléc és nincs 'Elfogadható válasz(ok):', a megoldás sorkizárt.
+    """
+    buf = BytesIO()
+    # Dokumentum
+    MARG = 2 * cm
+    doc = SimpleDocTemplate(
+        buf,
+        pagesize=A4,
+        leftMargin=MARG,
+        rightMargin=MARG,
+        topMargin=MARG,
+        bottomMargin=MARG,
+        pageCompression=1,  # tömörített stream-ek → kisebb letöltés
+        invariant=1,  # determinisztikus kimenet (nincs ID/időbélyeg-eltérés)
+    )
+    width, height = A4
+    usable_w = width - 2 * MARG
+    usable_h = height - 2 * MARG
+    # felső magassági korlát: a hasznos oldal magasságának 70%-a
+    MAX_IMG_H_FRAC = 0.70
+    max_img_h = usable_h * MAX_IMG_H_FRAC
+
+    # Stílusok (fontpáronként egyszer épülnek fel)
+    styles = _get_styles(font_reg, font_bold)
+    style_title = styles["title"]
+    style_q = styles["q"]
+    style_ans = styles["ans"]
+    style_meta = styles["meta"]
 
     story: List = []
     # Fejléc (cím + meta)
     now = datetime.now().strftime("%Y.%m.%d %H:%M")
     story.append(Paragraph(f"{PAGE_TITLE}", style_title))
     story.append(
-        Paragraph(f"Téma: <b>{theme_label}</b> (szám: {theme_number})", style_meta)
+        Paragraph(
+            f"Téma: <b>{_para_markup(theme_label)}</b> (szám: {theme_number})",
+            style_meta,
+        )
     )
     story.append(Paragraph(f"Generálva: {now}", style_meta))
     story.append(Spacer(1, 6))
@@ -371,13 +516,12 @@ def build_pdf(
     for idx, q in enumerate(questions, start=1):
         qid = qid_map.get(q, "")
         # Kérdés szövege (FÉLKÖVÉR)
-        story.append(Paragraph(q.replace("\n", "<br/>"), style_q))
+        story.append(Paragraph(_para_markup(q), style_q))
         # Válaszok – sorkizárt bekezdések
         ans_list = qa_map.get(q, [])
         if ans_list:
             for a in ans_list:
-                safe_a = a.replace("\n", "<br/>")
-                story.append(Paragraph(f"{safe_a}", style_ans))
+                story.append(Paragraph(_para_markup(a), style_ans))
         else:
             story.append(Paragraph("(Nincs válasz rögzítve)", style_ans))
         # Képek a válaszhoz — KLASSZIKUS FLOW (teljes szélesség + felső magassági korlát)
@@ -401,10 +545,15 @@ def build_pdf(
     return buf.getvalue()
 
 
-def build_pdf_all_themes(subjects: List[str], font_reg: str, font_bold: str) -> bytes:
+def build_pdf_all_themes(
+    subjects: List[str],
+    questions_by_theme: Dict[str, ThemeQuestions],
+    font_reg: str,
+    font_bold: str,
+) -> bytes:
     """
     Összes téma PDF: subject.csv soronként (1., 2., 3., ...),
-    mindegyik témához beolvassuk a kérdéseket és egy nagy, egységes PDF-et készítünk.
+    mindegyik témához az előre indexelt kérdésekből egy nagy, egységes PDF-et készítünk.
     Nincs kérdésfejléc és nincs 'Elfogadható válasz(ok):', a megoldás sorkizárt.
     """
     buf = BytesIO()
@@ -416,6 +565,8 @@ def build_pdf_all_themes(subjects: List[str], font_reg: str, font_bold: str) ->
         rightMargin=MARG,
         topMargin=MARG,
         bottomMargin=MARG,
+        pageCompression=1,  # tömörített stream-ek → kisebb letöltés
+        invariant=1,  # determinisztikus kimenet (nincs ID/időbélyeg-eltérés)
     )
     width, height = A4
     usable_w = width - 2 * MARG
@@ -424,48 +575,12 @@ def build_pdf_all_themes(subjects: List[str], font_reg: str, font_bold: str) ->
     MAX_IMG_H_FRAC = 0.50
     max_img_h = usable_h * MAX_IMG_H_FRAC
 
-    styles = getSampleStyleSheet()
-    style_title = styles["Title"]
-    style_title.fontName = font_bold
-    style_title.fontSize = 18
-    style_title.spaceAfter = 12
-
-    style_h1 = styles["Heading1"]
-    style_h1.fontName = font_bold
-    style_h1.fontSize = 16
-    style_h1.spaceBefore = 14
-    style_h1.spaceAfter = 8
-
-    # KÉRDÉS: félkövér
-    style_q = ParagraphStyle(
-        name="Question",
-        parent=styles["BodyText"],
-        fontName=font_bold,  # ← félkövér kérdés
-        fontSize=12,
-        leading=15,
-        alignment=TA_LEFT,  # igény szerint TA_JUSTIFY
-        spaceAfter=6,
-    )
-
-    style_ans = ParagraphStyle(
-        name="Answer",
-        parent=styles["BodyText"],
-        fontName=font_reg,
-        fontSize=11,
-        leading=14,
-        leftIndent=10,
-        spaceAfter=2,
-        alignment=TA_JUSTIFY,
-    )
-
-    style_meta = ParagraphStyle(
-        name="Meta",
-        parent=styles["BodyText"],
-        fontName=font_reg,
-        fontSize=9,
-        textColor="#666",
-        spaceAfter=6,
-    )
+    styles = _get_styles(font_reg, font_bold)
+    style_title = styles["title"]
+    style_h1 = styles["h1"]
+    style_q = styles["q"]
+    style_ans = styles["ans"]
+    style_meta = styles["meta"]
 
     story: List = []
     now = datetime.now().strftime("%Y.%m.%d %H:%M")
@@ -475,19 +590,30 @@ def build_pdf_all_themes(subjects: List[str], font_reg: str, font_bold: str) ->
     story.append(Paragraph(f"Generálva: {now}", style_meta))
     story.append(Spacer(1, 8))
 
+    # Az összes érintett kép méretét előre, párhuzamosan olvassuk be;
+    # a story-építés alatt _rl_img_scaled már a cache-ből dolgozik.
+    _prefetch_image_sizes(
+        [
+            p
+            for _, _, qid_map in questions_by_theme.values()
+            for qid in qid_map.values()
+            for p in find_answer_images(qid)
+        ]
+    )
+
     # Témák végigjárása
     for si, subj in enumerate(subjects, start=1):
-        m = re.match(r"^\s*(\d+)", subj)
+        m = _THEME_NUM_RE.match(subj)
         if not m:
             # ha nem nyerhető ki szám, kihagyjuk
             continue
         theme_number = m.group(1)
         # Téma-fejléc (meghagyjuk, mert ezt nem kérted eltávolítani)
-        story.append(Paragraph(f"{subj}", style_h1))
+        story.append(Paragraph(_para_markup(subj), style_h1))
         story.append(Spacer(1, 4))
 
         # Téma kérdései
-        questions, qa_map, qid_map = load_questions(FILE_ELM, theme_number)
+        questions, qa_map, qid_map = questions_by_theme.get(theme_number, ([], {}, {}))
         if not questions:
             story.append(Paragraph("(Ehhez a témához nem található kérdés.)", style_q))
             if si < len(subjects):
@@ -497,13 +623,12 @@ def build_pdf_all_themes(subjects: List[str], font_reg: str, font_bold: str) ->
         for q in questions:
             qid = qid_map.get(q, "")
             # Kérdés (FÉLKÖVÉR)
-            story.append(Paragraph(q.replace("\n", "<br/>"), style_q))
+            story.append(Paragraph(_para_markup(q), style_q))
             # Válaszok – sorkizárt bekezdések
             ans_list = qa_map.get(q, [])
             if ans_list:
                 for a in ans_list:
-                    safe_a = a.replace("\n", "<br/>")
-                    story.append(Paragraph(f"{safe_a}", style_ans))
+                    story.append(Paragraph(_para_markup(a), style_ans))
             else:
                 story.append(Paragraph("(Nincs válasz rögzítve)", style_ans))
             # Képek — KLASSZIKUS FLOW + felső magassági korlát
@@ -528,14 +653,51 @@ def build_pdf_all_themes(subjects: List[str], font_reg: str, font_bold: str) ->
     return buf.getvalue()
 
 
+# ─────────────────────────────────────────────────────────
+# Bemelegítés: témák, témánkénti kérdésindex és PDF-fontok egy erőforrásban – ez az
+# egyetlen cache-rétegük (a képindexet a find saját cache-e kezeli).
+# A kulcsok a fájlok verziói, így módosításkor automatikusan újraépül.
+@st.cache_resource(show_spinner="Adatok betöltése...")
+def _warmup(
+    subjects_key: Tuple[str, int, int],
+    questions_key: Tuple[str, int, int],
+) -> Dict[str, object]:
+    return {
+        "subjects": _load_subjects(subjects_key[0]),
+        "questions_by_theme": _load_all_questions_indexed(*questions_key),
+        "fonts": register_hungarian_font(),
+    }
+
+
+def app_data() -> Dict[str, object]:
+    if not FILE_SUBJECTS.exists():
+        st.error(f"Hiányzik: {FILE_SUBJECTS}")
+        st.stop()
+    try:
+        return _warmup(_file_key(FILE_SUBJECTS), _file_key(FILE_ELM))
+    except MissingColumnsError:
+        st.error(
+            "Az elmeleti_kerdes_valaszok.csv-ben hiányzik a 'question' és/vagy 'answer' oszlop."
+        )
+        st.stop()
+
+
+def reload_data() -> None:
+    _warmup.clear()
+    _build_image_index.clear()
+
+
 # ─────────────────────────────────────────────────────────
 # Oldalsáv UI
 st.sidebar.header("Beállítások")
-subjects = load_subjects(FILE_SUBJECTS)
+st.sidebar.button("🔄 Adatok újratöltése", on_click=reload_data)
+data = app_data()
+subjects: List[str] = data["subjects"]
+questions_by_theme: Dict[str, ThemeQuestions] = data["questions_by_theme"]
 tema_full = st.sidebar.selectbox("Téma", options=subjects)
 
 # subject.csv sorai pl.: "2. Váltóáram"
-m = re.match(r"^\s*(\d+)", tema_full)
+m = _THEME_NUM_RE.match(tema_full)
 if not m:
     st.error("A subject.csv sorai nem tartalmazzák a témaszámot a sor elején!")
     st.stop()
@@ -566,7 +728,7 @@ tema_szam = st.session_state["theme"]
 
 # ─────────────────────────────────────────────────────────
 # kérdések betöltése
-questions, qa_map, qid_map = load_questions(FILE_ELM, tema_szam)
+questions, qa_map, qid_map = questions_by_theme.get(tema_szam, ([], {}, {}))
 if not questions:
     st.warning("Ehhez a témához nem található kérdés.")
     st.stop()
@@ -582,14 +744,14 @@ st.title(f"{PAGE_ICON} {PAGE_TITLE}")
 st.caption(f"Téma: **{tema_full}** • Kérdések száma: **{len(questions)}**")
 st.divider()
 
+
 # ─────────────────────────────────────────────────────────
-# Kérdések listája (app UI – változatlanul hagyva)
-for idx, q in enumerate(questions, start=1):
-    bg = (
-        "#eaffea"
-        if st.session_state.mark.get(q) == "helyes"
-        else "#ffecec" if st.session_state.mark.get(q) == "hibas" else "#ffffff"
-    )
+# Kérdések listája – kérdésenként egy fragment: a „Válasz megjelenítése” gomb
+# csak az adott blokkot futtatja újra, nem a teljes scriptet.
+@st.fragment
+def render_question(idx: int, q: str) -> None:
+    mark = st.session_state.mark.get(q)
+    bg = "#eaffea" if mark == "helyes" else "#ffecec" if mark == "hibas" else "#ffffff"
     st.markdown(
         f"""
         <div style="border:1px solid #ccc;border-radius:8px;padding:14px;background:{bg}">
@@ -605,8 +767,10 @@ for idx, q in enumerate(questions, start=1):
     with cB:
         if st.session_state.show_answer[q]:
             st.success("Megoldás(ok):")
-            for i, ans in enumerate(qa_map[q], 1):
-                st.markdown(f"**{i})** {ans}")
+            # egyetlen markdown-blokk az összes válaszra
+            st.markdown(
+                "\n\n".join(f"**{i})** {ans}" for i, ans in enumerate(qa_map[q], 1))
+            )
             # válaszképek (csak akkor, ha van qid)
             qid = qid_map.get(q)
             if qid:
@@ -619,12 +783,20 @@ for idx, q in enumerate(questions, start=1):
         val = st.radio(
             "Önértékelés:",
             ["Helyesnek ítélem", "Nem volt helyes"],
-            index=0 if st.session_state.mark[q] in (None, "helyes") else 1,
+            index=0 if mark in (None, "helyes") else 1,
             key=f"eval_{idx}",
             horizontal=True,
         )
-        st.session_state.mark[q] = "helyes" if val == "Helyesnek ítélem" else "hibas"
+        new_mark = "helyes" if val == "Helyesnek ítélem" else "hibas"
+        st.session_state.mark[q] = new_mark
     st.write("---")
+    if mark is not None and new_mark != mark:
+        # az ítélet a kártya színét és az exportokat is érinti → teljes rerun
+        st.rerun()
+
+
+for idx, q in enumerate(questions, start=1):
+    render_question(idx, q)
 
 
 # ─────────────────────────────────────────────────────────
@@ -636,11 +808,49 @@ def summarize():
     st.session_state.summary = {"total": total, "done": done, "good": good}
 
 
+# Export-builderek: csak az „Export előkészítése” gombra futnak (nem minden rerunnál).
+# items: ((kérdés, qid, (válaszok...), ítélet), ...)
+ExportItems = Tuple[Tuple[str, Optional[str], Tuple[str, ...], Optional[str]], ...]
+
+
+def build_export_json(
+    theme_label: str,
+    theme_number: str,
+    summary: Tuple[int, int, int],
+    items: ExportItems,
+) -> bytes:
+    total, done, good = summary
+    export = {
+        "tema": theme_label,
+        "tema_szam": theme_number,
+        "osszes_kerdes": total,
+        "onertekeltek": done,
+        "helyesnek_iteltek": good,
+        "reszletek": [
+            {"kerdes": q, "qid": qid, "valaszok": list(answers), "itel": mark}
+            for q, qid, answers, mark in items
+        ],
+    }
+    if orjson is not None:
+        # orjson: C-ben szerializál, és eleve UTF-8 bájtokat ad vissza
+        return orjson.dumps(export, option=orjson.OPT_INDENT_2)
+    return json.dumps(export, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def build_export_csv(theme_label: str, items: ExportItems) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["index", "tema", "qid", "question", "mark", "answers"])
+    for i, (q, qid, answers, mark) in enumerate(items, 1):
+        w.writerow([i, theme_label, qid, q, mark, " \n".join(answers)])
+    return buf.getvalue()
+
+
 # Összesítés gomb
 st.button("📊 Összesítés", on_click=summarize)
 
 # Magyar font regisztrálása (PDF-hez)
-font_reg, font_bold, unicode_ok = register_hungarian_font()
+font_reg, font_bold, unicode_ok = data["fonts"]
 if not unicode_ok:
     st.warning(
         "A PDF‑hez nem találtam DejaVu Sans TTF‑et az alkalmazás mappájában. "
@@ -673,7 +883,10 @@ if st.button("🖨️ PDF generálása (aktuális téma)"):
 if st.button("🖨️ PDF generálása (ÖSSZES TÉMA)"):
     with st.spinner("PDF készítése az összes témából..."):
         pdf_bytes_all = build_pdf_all_themes(
-            subjects=subjects, font_reg=font_reg, font_bold=font_bold
+            subjects=subjects,
+            questions_by_theme=questions_by_theme,
+            font_reg=font_reg,
+            font_bold=font_bold,
         )
     st.success("Összes témát tartalmazó PDF elkészült.")
     st.download_button(
@@ -692,35 +905,28 @@ if st.session_state.summary:
         f"Önértékelt: **{s['done']}**, "
         f"Helyesnek ítélt: **{s['good']}**"
     )
-    export = {
-        "tema": tema_full,
-        "tema_szam": tema_szam,
-        "osszes_kerdes": s["total"],
-        "onertekeltek": s["done"],
-        "helyesnek_iteltek": s["good"],
-        "reszletek": [
-            {
-                "kerdes": q,
-                "qid": qid_map.get(q),
-                "valaszok": qa_map[q],
-                "itel": st.session_state.mark.get(q),
-            }
-            for q in questions
-        ],
-    }
+
+# Exportok – csak kérésre épülnek fel (CSV mindig, JSON ha volt összesítés)
+if st.button("📦 Export előkészítése"):
+    export_items: ExportItems = tuple(
+        (q, qid_map.get(q), tuple(qa_map[q]), st.session_state.mark.get(q))
+        for q in questions
+    )
+    if st.session_state.summary:
+        s = st.session_state.summary
+        st.download_button(
+            "📥 Export JSON",
+            build_export_json(
+                tema_full, tema_szam, (s["total"], s["done"], s["good"]), export_items
+            ),
+            "biofizika_eredmeny.json",
+            "application/json",
+            on_click="ignore",  # letöltéskor ne fusson újra az app (a gomb látható marad)
+        )
     st.download_button(
-        "📥 Export JSON",
-        json.dumps(export, ensure_ascii=False, indent=2).encode("utf-8"),
-        "biofizika_eredmeny.json",
-        "application/json",
+        "⬇️ Export CSV",
+        build_export_csv(tema_full, export_items),
+        "biofizika_eredmeny.csv",
+        "text/csv",
+        on_click="ignore",
     )
-
-# CSV export – mindig elérhető
-buf = io.StringIO()
-w = csv.writer(buf)
-w.writerow(["index", "tema", "qid", "question", "mark", "answers"])
-for i, q in enumerate(questions, 1):
-    ans_join = " \n".join(qa_map[q])
-    mk = st.session_state.mark.get(q)
-    w.writerow([i, tema_full, qid_map.get(q), q, mk, ans_join])
-st.download_button("⬇️ Export CSV", buf.getvalue(), "biofizika_eredmeny.csv", "text/csv")
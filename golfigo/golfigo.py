@@ -1,15 +1,18 @@
 from __future__ import annotations
 import os
-import io
-import csv
 import json
 import re
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Optional
+from urllib.parse import urlsplit
 
 import streamlit as st
+import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
+import lxml.etree
+import lxml.html
 from playwright.sync_api import (
     sync_playwright,
     TimeoutError as PWTimeout,
@@ -36,8 +39,64 @@ APPROVED_ENGINE = st.secrets.get(
     "APPROVED_ENGINE", "chromium"
 ).lower()  # chromium|webkit|firefox
 
+# Playwright storage state (session sütik) – ezzel a belépés kihagyható. A repón kívül,
+# a felhasználó saját cache-mappájában él, hogy véletlenül se kerüljön verziókezelésbe.
+STORAGE_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "golfigo")
+STORAGE_STATE_FILE = "state.json"
+# Ennél régebbi mentett sessiont nem próbálunk (a sütik úgyis lejártak) – rögtön belépünk
+STORAGE_STATE_MAX_AGE_S = 12 * 3600
+# A HCP oldal "kész": megjelent a táblázat első adatcellája, vagy visszadobott a loginra
+HCP_READY_SELECTOR = "table tr td, input[type='password']"
+# Csak a HTML/JS/CSS kell: képek, fontok, média és trackerek letöltését megszakítjuk
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+TRACKER_HOST_RE = re.compile(
+    r"googletagmanager|google-analytics|doubleclick|hotjar|facebook", re.I
+)
+# Cookie-banner elfogadó és login submit gombok (HU/EN) – egy-egy vesszős CSS szelektor
+COOKIE_ACCEPT_SELECTOR = ", ".join(
+    (
+        "#onetrust-accept-btn-handler",
+        "button:has-text('Elfogadom')",
+        "button:has-text('Rendben')",
+        "button:has-text('Összes elfogadása')",
+        "button:has-text('Accept')",
+        "button:has-text('I agree')",
+        "button:has-text('Allow all')",
+    )
+)
+SUBMIT_SELECTOR = ", ".join(
+    (
+        "button[type='submit']",
+        "input[type='submit']",
+        "button:has-text('Belépés')",
+        "button:has-text('Bejelentkezés')",
+        "button:has-text('Login')",
+        "button:has-text('Sign in')",
+    )
+)
+# Zscaler "unsupported browser" blokkoló oldal szövege
+ZSCALER_BLOCK_TEXT = "this web browser is not approved"
+# Login-mezők és a belépett állapot jelei (egyszer fordítva, egyetlen DOM-lekérdezéshez)
+EMAIL_RE = re.compile(r"e-?mail", re.I)
+PASSWORD_RE = re.compile(r"jelszó|password", re.I)
+LOGGED_IN_RE = re.compile(
+    r"Fiók|Profil|Kijelentkezés|Kilépés|Account|Profile|Sign out|Logout", re.I
+)
+
 
 # ============================ Segédfüggvények ============================
+# A HCP oldalon előforduló dátumformátumok (a záró pont levágása után)
+DATE_FORMATS = ("%Y.%m.%d", "%Y-%m-%d", "%Y.%m.%d %H:%M", "%d.%m.%Y", "%Y. %m. %d")
+# Ennyi kitöltött cellának kell illeszkednie, hogy a formátumot elfogadjuk
+DATE_FORMAT_MIN_RATIO = 0.8
+# Dátumra utaló fejlécek – ezeket az oszlopokat próbáljuk elsőként
+DATE_HEADER_RE = re.compile(r"dátum|date|idő|time", re.I)
+# Előszűrés: számjegyes dátumminta (pl. 2024.05.01, 2024. 05. 01, 01.05.2024, 2024-05-01)
+# a minta elején; az elválasztó után szóköz is állhat
+DATE_LIKE_RE = re.compile(r"\d{1,4}[./-]\s*\d{1,2}[./-]\s*\d{1,4}")
+DATE_SAMPLE_SIZE = 20
+
+
 def ensure_snapshots_dir() -> str:
     os.makedirs("snapshots", exist_ok=True)
     return "snapshots"
@@ -49,96 +108,140 @@ def save_html(path: str, html: str) -> None:
         f.write(html)
 
 
-def parse_first_table(html: str) -> Tuple[List[str], List[List[str]]]:
-    """Kinyeri az első <table>-t (vagy fallback: bármely <tr> struktúra)."""
-    soup = BeautifulSoup(html, "html.parser")
-    table = soup.find("table")
-    if not table:
-        rows: List[List[str]] = []
-        for tr in soup.select("tr"):
-            tds = [
-                td.get_text(strip=True).replace("\n", " ") for td in tr.find_all("td")
-            ]
-            if tds:
-                rows.append(tds)
-        if not rows:
-            return [], []
-        n = max(len(r) for r in rows)
-        headers = [f"col_{i+1}" for i in range(n)]
-        rows = [r + [""] * (n - len(r)) for r in rows]
-        return headers, rows
-
-    headers = [th.get_text(strip=True) for th in table.find_all("th")]
-    rows: List[List[str]] = []
-    for tr in table.find_all("tr"):
-        tds = tr.find_all("td")
-        if not tds:
-            continue
-        rows.append([td.get_text(strip=True).replace("\n", " ") for td in tds])
+# Csak szöveg kell: kommentek/PI-k és üres szövegcsomópontok nélkül, id-index nélkül
+_TABLE_HTML_PARSER = lxml.html.HTMLParser(
+    remove_comments=True, remove_pis=True, remove_blank_text=True, collect_ids=False
+)
 
-    if not headers and rows:
+
+def _cell_text(el) -> str:
+    """A cella szövege: a szövegdarabok szóközzel, minden whitespace-sorozat egy szóközzé."""
+    return " ".join(" ".join(el.itertext()).split())
+
+
+def parse_first_table(html: str) -> pd.DataFrame:
+    """Kinyeri az első <table>-t (vagy fallback: bármely <tr> struktúra) DataFrame-be."""
+    try:
+        root = lxml.html.fromstring(html, parser=_TABLE_HTML_PARSER)
+    except (lxml.etree.ParserError, ValueError):
+        return pd.DataFrame()
+    table = next(root.iter("table"), None)
+    scope = root if table is None else table
+
+    headers = [] if table is None else [_cell_text(th) for th in table.iter("th")]
+    rows: List[List[str]] = [
+        tds
+        for tr in scope.iter("tr")
+        if (tds := [_cell_text(td) for td in tr.iter("td")])
+    ]
+    if not rows:
+        return pd.DataFrame(columns=headers)
+
+    if not headers:
         n = max(len(r) for r in rows)
         headers = [f"col_{i+1}" for i in range(n)]
-        rows = [r + [""] * (len(headers) - len(r)) for r in rows]
-    else:
-        rows = [r + [""] * (len(headers) - len(r)) for r in rows]
-    return headers, rows
+    rows = [r + [""] * (len(headers) - len(r)) for r in rows]
+    return pd.DataFrame(rows, columns=headers)
 
 
 def detect_and_sort_by_datetime(
-    headers: List[str], rows: List[List[str]]
+    df: pd.DataFrame,
 ) -> Tuple[pd.DataFrame, Optional[str]]:
     """
     Megpróbáljuk megtalálni a dátumoszlopot:
-    - minden oszlopra to_datetime (dayfirst=True, errors='coerce')
+    - csak a dátumszerű mintájú oszlopokra to_datetime: előbb a DATE_FORMATS fix formátumai,
+      ha egyik sem illeszkedik, akkor dayfirst=True (errors='coerce')
     - amelyikben a legtöbb érvényes dátum keletkezik, azt választjuk
+      (a dátumnevű oszlopok előre kerülnek; egyértelmű találatnál nem keresünk tovább)
     - arra rendezünk DESC (legújabb elöl)
     Visszatér: rendezett DataFrame, és a választott oszlop neve (vagy None).
     """
-    if not headers or not rows:
+    if df.empty:
         return pd.DataFrame(), None
 
-    df = pd.DataFrame(rows, columns=headers)
-
-    # Előfeldolgozás: ponttal végződő YYYY.MM.DD. minták letakarítása a próbához
-    def _clean_date_strings(s: pd.Series) -> pd.Series:
-        return s.astype(str).str.strip().str.replace(r"\.$", "", regex=True)
+    # Dátumra utaló nevű oszlopok előre (stabil rendezés, különben eredeti sorrend)
+    columns = sorted(df.columns, key=lambda c: not DATE_HEADER_RE.search(str(c)))
+    n_rows = len(df)
 
     best_col = None
     best_ok = -1
-    parsed_cache = {}
-
-    for col in df.columns:
-        s = _clean_date_strings(df[col])
-        parsed = pd.to_datetime(s, errors="coerce", dayfirst=True, utc=False)
+    best_parsed = None
+
+    for col in columns:
+        # Előfeldolgozás: a záró pont(ok) levágása a YYYY.MM.DD. mintákról –
+        # numpy unicode-tömbön (np.char), elemenkénti Python-hívások nélkül
+        s = pd.Series(
+            np.char.rstrip(np.char.strip(df[col].to_numpy(dtype=str)), "."),
+            index=df.index,
+        )
+        nonempty = s[s != ""]
+        # Olcsó előszűrés: ha az első pár kitöltött érték egyike sem dátumszerű,
+        # a drága to_datetime hívásokat kihagyjuk
+        if not nonempty.head(DATE_SAMPLE_SIZE).str.match(DATE_LIKE_RE).any():
+            continue
+        filled = len(nonempty)
+        parsed = None
+        # Fix formátumok: gyors C-útvonal; a dayfirst próba csak fallback
+        for fmt in DATE_FORMATS:
+            cand = pd.to_datetime(s, format=fmt, errors="coerce")
+            if filled and cand.notna().sum() >= DATE_FORMAT_MIN_RATIO * filled:
+                parsed = cand
+                break
+        if parsed is None:
+            parsed = pd.to_datetime(s, errors="coerce", dayfirst=True, utc=False)
         ok_count = parsed.notna().sum()
-        parsed_cache[col] = parsed
         if ok_count > best_ok:
             best_ok = ok_count
             best_col = col
+            best_parsed = parsed
+        # Korai kilépés: teljes találat, vagy dátumnevű oszlopon legalább 95%
+        if ok_count == n_rows or (
+            ok_count >= 0.95 * n_rows and DATE_HEADER_RE.search(str(col))
+        ):
+            break
 
     if best_col is None or best_ok == 0:
         # Nem találtunk használható dátumoszlopot – visszaadjuk az eredetit
         return df, None
 
-    df["_parsed_dt"] = parsed_cache[best_col]
-    df = df.sort_values(by="_parsed_dt", ascending=False, kind="stable").drop(
-        columns=["_parsed_dt"]
-    )
-    return df, best_col
+    # Csökkenő, stabil rendezés egyetlen numpy argsorttal (ideiglenes oszlop nélkül):
+    # a negált ns-értékeken stabil argsort, a NaT-k a végére kerülnek
+    parsed = best_parsed
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        # Vegyes időzónás (object) eredmény – marad a pandas rendezés
+        order = (
+            parsed.reset_index(drop=True)
+            .sort_values(ascending=False, kind="stable")
+            .index
+        )
+    else:
+        ns = pd.DatetimeIndex(parsed).asi8
+        keys = np.where(parsed.notna().to_numpy(), -ns, np.iinfo(np.int64).max)
+        order = np.argsort(keys, kind="stable")
+    return df.iloc[order], best_col
+
+
+def build_sorted_table(html: str) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Tábla kinyerés + dátum szerinti rendezés (cache nélkül: a letöltött oldal minden futásnál más)."""
+    return detect_and_sort_by_datetime(parse_first_table(html))
 
 
-def save_to_csv(headers: List[str], rows: List[List[str]], path: str) -> bytes:
+def save_to_csv(df: pd.DataFrame, path: str) -> None:
+    """A rendezett táblát egy lépésben, közvetlenül fájlba írja (pandas C CSV-író)."""
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    buf = io.StringIO()
-    w = csv.writer(buf, delimiter=";")
-    if headers:
-        w.writerow(headers)
-    w.writerows(rows)
-    data = buf.getvalue().encode("utf-8")
-    with open(path, "wb") as f:
-        f.write(data)
-    return data
+    df.to_csv(path, index=False, sep=";", encoding="utf-8")
+
+
+def _sqlite_ident(name) -> str:
+    """SQLite azonosító idézése ("..." és a belső " duplázása)."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sqlite_type(dtype) -> str:
+    """pandas dtype → SQLite oszloptípus (mint a to_sql alapértelmezése)."""
+    return {"i": "INTEGER", "u": "INTEGER", "b": "INTEGER", "f": "REAL"}.get(
+        dtype.kind, "TEXT"
+    )
 
 
 def save_to_sqlite(
@@ -147,38 +250,54 @@ def save_to_sqlite(
     if df.empty:
         raise ValueError("Üres DataFrame, nem tudok SQLite táblát létrehozni.")
     os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    name = _sqlite_ident(table)
+    columns = ", ".join(
+        f"{_sqlite_ident(c)} {_sqlite_type(t)}" for c, t in df.dtypes.items()
+    )
+    placeholders = ", ".join("?" * len(df.columns))
+    # NaN → NULL, numpy skalárok → Python értékek
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
     try:
-        with conn:
-            # Felülírjuk a táblát a rendezett eredménnyel
-            df.to_sql(table, conn, if_exists="replace", index=False)
+        # A tábla minden letöltéskor teljesen újragenerálódik a HCP oldalból,
+        # így a tartós naplózás/fsync felesleges költség
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        conn.execute("PRAGMA synchronous=OFF")
+        # Felülírjuk a táblát a rendezett eredménnyel – egyetlen tranzakcióban
+        conn.execute("BEGIN")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute(f"CREATE TABLE {name} ({columns})")
+            conn.executemany(f"INSERT INTO {name} VALUES ({placeholders})", rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
     finally:
         conn.close()
 
 
+def build_search_text(df: pd.DataFrame) -> pd.Series:
+    """Soronként egy casefold-olt keresőszöveg: az összes cella egy vezérlőkarakterrel összefűzve."""
+    cells = df.astype(str)
+    first, rest = cells.iloc[:, 0], [cells.iloc[:, i] for i in range(1, cells.shape[1])]
+    return first.str.cat(rest, sep="\x1f").str.casefold()
+
+
 # ============================ Playwright login & letöltés ============================
 def _try_accept_cookies(page, diag: dict, timeout_ms: int = 5000) -> None:
     """HU/EN cookie-banner gombok best-effort bezárása (OneTrust is)."""
     try:
-        candidates = [
-            "#onetrust-accept-btn-handler",
-            "button#onetrust-accept-btn-handler",
-            "button:has-text('Elfogadom')",
-            "button:has-text('Rendben')",
-            "button:has-text('Összes elfogadása')",
-            "button:has-text('Accept')",
-            "button:has-text('I agree')",
-            "button:has-text('Allow all')",
-        ]
-        for sel in candidates:
-            btn = page.locator(sel)
-            if btn.count() > 0:
-                try:
-                    btn.first.click(timeout=timeout_ms)
-                    diag.setdefault("cookie_accepted", []).append(sel)
-                    page.wait_for_timeout(200)
-                except Exception:
-                    pass
+        # Egyetlen locator (egy CDP-kör) az összes HU/EN/OneTrust elfogadó gombra
+        btn = page.locator(COOKIE_ACCEPT_SELECTOR).first
+        if btn.count() > 0:
+            try:
+                btn.click(timeout=timeout_ms)
+                diag.setdefault("cookie_accepted", []).append(COOKIE_ACCEPT_SELECTOR)
+                page.wait_for_timeout(200)
+            except Exception:
+                pass
         overlay = page.locator("[role='dialog'], .modal, .overlay")
         if overlay.count() > 0:
             try:
@@ -215,9 +334,9 @@ def _fill_and_submit_login(
     # E-mail (konkrét placeholder → label → role → szűk CSS fallback)
     email_priority = [
         frame.get_by_placeholder("E-mail cím"),
-        frame.get_by_placeholder(re.compile(r"e-?mail", re.I)),
-        frame.get_by_label(re.compile(r"e-?mail", re.I)),
-        frame.get_by_role("textbox", name=re.compile(r"e-?mail", re.I)),
+        frame.get_by_placeholder(EMAIL_RE),
+        frame.get_by_label(EMAIL_RE),
+        frame.get_by_role("textbox", name=EMAIL_RE),
         frame.locator(
             "input[type='email'], input[type='text'][name*='mail' i], input[type='text'][id*='mail' i]"
         ),
@@ -239,9 +358,9 @@ def _fill_and_submit_login(
 
     # Jelszó
     password_priority = [
-        frame.get_by_label(re.compile(r"jelszó|password", re.I)),
-        frame.get_by_placeholder(re.compile(r"jelszó|password", re.I)),
-        frame.get_by_role("textbox", name=re.compile(r"jelszó|password", re.I)),
+        frame.get_by_label(PASSWORD_RE),
+        frame.get_by_placeholder(PASSWORD_RE),
+        frame.get_by_role("textbox", name=PASSWORD_RE),
         frame.locator(
             "input[type='password'], input[name*='pass' i], input[id*='pass' i]"
         ),
@@ -263,24 +382,18 @@ def _fill_and_submit_login(
 
     # Submit (HU/EN variánsok)
     submitted = False
-    for sel in [
-        "button[type='submit']",
-        "input[type='submit']",
-        "button:has-text('Belépés')",
-        "button:has-text('Bejelentkezés')",
-        "button:has-text('Login')",
-        "button:has-text('Sign in')",
-    ]:
-        btn = frame.locator(sel).first
-        if btn.count() > 0:
-            try:
-                btn.wait_for(state="visible", timeout=int(timeout_ms / 2))
-                btn.click(timeout=timeout_ms)
-                diag["submit_selector"] = sel
-                submitted = True
-                break
-            except Exception:
-                continue
+    # Egyetlen locator az összes variánsra; az első látható gombot nyomjuk meg.
+    # A click maga eseményalapúan megvárja, hogy a gomb látható és engedélyezett legyen
+    # (actionability check) – külön wait_for / polling nem kell.
+    buttons = frame.locator(SUBMIT_SELECTOR)
+    if buttons.count() > 0:
+        btn = buttons.filter(visible=True).first
+        try:
+            btn.click(timeout=int(timeout_ms / 2))
+            diag["submit_selector"] = SUBMIT_SELECTOR
+            submitted = True
+        except Exception:
+            pass
     if not submitted:
         try:
             pass_loc.press("Enter", timeout=timeout_ms)
@@ -291,20 +404,105 @@ def _fill_and_submit_login(
 
 def _looks_logged_in(page) -> bool:
     """Durva heurisztika: látszik-e belépett állapotú elem."""
-    hints = [
-        "Fiók",
-        "Profil",
-        "Kijelentkezés",
-        "Kilépés",
-        "Account",
-        "Profile",
-        "Sign out",
-        "Logout",
-    ]
-    for h in hints:
-        if page.get_by_text(re.compile(h, re.I)).count() > 0:
-            return True
-    return False
+    return page.get_by_text(LOGGED_IN_RE).count() > 0
+
+
+def _storage_state_path() -> str:
+    """A mentett session útvonala (a mappa csak a tulajdonosnak olvasható)."""
+    os.makedirs(STORAGE_STATE_DIR, mode=0o700, exist_ok=True)
+    return os.path.join(STORAGE_STATE_DIR, STORAGE_STATE_FILE)
+
+
+def _state_is_fresh(state_path: str) -> bool:
+    """Van-e STORAGE_STATE_MAX_AGE_S-nél frissebb mentett session."""
+    try:
+        return time.time() - os.path.getmtime(state_path) < STORAGE_STATE_MAX_AGE_S
+    except OSError:
+        return False
+
+
+def _login(
+    page, login_url: str, username: str, password: str, diag: dict, timeout_ms: int
+) -> None:
+    """A login oldal megnyitása és az űrlap beküldése (login oldal tartalmát nem mentjük)."""
+    page.goto(login_url, wait_until="domcontentloaded")
+    # Zscaler unsupported browser blokkolás korai detektálása
+    # (a teljes DOM szerializálása helyett a böngészőben keresünk rá a szövegre)
+    try:
+        blocked = ("Zscaler" in page.title()) or page.evaluate(
+            "t => document.documentElement.outerHTML.includes(t)", ZSCALER_BLOCK_TEXT
+        )
+    except (PWTimeout, PWError):
+        blocked = False
+    if blocked:
+        diag["zscaler_block"] = {
+            "engine": APPROVED_ENGINE,
+            "user_agent": APPROVED_UA,
+            "url": page.url,
+        }
+        raise RuntimeError(
+            "Zscaler policy blokkolja a böngészőt/UA-t (unsupported browser)."
+        )
+
+    # networkidle helyett: az űrlapmezők láthatóságára _fill_and_submit_login vár
+    _try_accept_cookies(page, diag)
+
+    # Nem mentünk login oldal tartalmat – csak belépünk
+    frame = _select_frame_with_login(page, diag)
+    _fill_and_submit_login(frame, username, password, diag, timeout_ms)
+
+
+def _block_heavy_requests(route) -> None:
+    """context.route handler: a felesleges erőforrásokat és trackereket eldobja."""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or TRACKER_HOST_RE.search(
+        urlsplit(request.url).hostname or ""
+    ):
+        route.abort()
+    else:
+        route.continue_()
+
+
+@st.cache_resource
+def _playwright_runtime() -> dict:
+    """
+    Rerunok között megmaradó Playwright-futtató: egy dedikált szál + az azon
+    indított böngészők. A sync Playwright objektumok ahhoz a szálhoz kötöttek,
+    amelyen létrejöttek, a Streamlit viszont minden rerunt új szálon futtat –
+    ezért minden Playwright-hívás ezen az egy szálon fut.
+    """
+    return {
+        "executor": ThreadPoolExecutor(max_workers=1, thread_name_prefix="playwright"),
+        "playwright": None,
+        "browser": None,
+        "browser_key": None,
+    }
+
+
+def _get_browser(runtime: dict, headful: bool, slow_mo_ms: int):
+    """
+    Az egyetlen, rerunok között megtartott böngésző; csak a Playwright-szálon hívható.
+    Ha a motor/headful/slow-mo beállítás változott, a régit bezárjuk és újat indítunk.
+    """
+    key = (APPROVED_ENGINE, headful, slow_mo_ms)
+    browser = runtime["browser"]
+    if browser is not None and browser.is_connected() and runtime["browser_key"] == key:
+        return browser
+    if browser is not None:
+        try:
+            browser.close()
+        except PWError:
+            pass
+    if runtime["playwright"] is None:
+        runtime["playwright"] = sync_playwright().start()
+    p = runtime["playwright"]
+    # Motor kiválasztása
+    launcher = {"chromium": p.chromium, "webkit": p.webkit, "firefox": p.firefox}.get(
+        APPROVED_ENGINE, p.chromium
+    )
+    runtime["browser"] = launcher.launch(headless=not headful, slow_mo=slow_mo_ms)
+    runtime["browser_key"] = key
+    return runtime["browser"]
 
 
 def playwright_fetch_hcp_sorted(
@@ -317,123 +515,143 @@ def playwright_fetch_hcp_sorted(
     slow_mo_ms: int = 0,
     timeout_ms: int = 45000,
     ignore_https_errors: bool = False,
+    save_snapshots: bool = False,
 ) -> Tuple[pd.DataFrame, Optional[str]]:
     """
     Belépés Playwright-tel, majd CSAK a hcp_url oldal tartalmát töltjük le,
     kinyerjük az első táblát és dátum szerint sorba rendezzük.
     Visszatér: rendezett DataFrame + a választott dátumoszlop neve (ha volt).
+    A böngésző rerunok között újrahasznosul; futásonként csak új context/page nyílik.
     """
-    snaps = ensure_snapshots_dir()
-    with sync_playwright() as p:
-        # Motor kiválasztása
-        if APPROVED_ENGINE == "chromium":
-            browser = p.chromium.launch(headless=not headful, slow_mo=slow_mo_ms)
-        elif APPROVED_ENGINE == "webkit":
-            browser = p.webkit.launch(headless=not headful, slow_mo=slow_mo_ms)
-        elif APPROVED_ENGINE == "firefox":
-            browser = p.firefox.launch(headless=not headful, slow_mo=slow_mo_ms)
-        else:
-            browser = p.chromium.launch(headless=not headful, slow_mo=slow_mo_ms)
-
-        context = browser.new_context(
-            locale="hu-HU",
-            user_agent=APPROVED_UA,
-            ignore_https_errors=ignore_https_errors,
-        )
-        page = context.new_page()
-        page.set_default_timeout(timeout_ms)
-        page.set_default_navigation_timeout(timeout_ms)
-
-        # Diagnosztika
-        diag.update(
-            {
-                "engine": APPROVED_ENGINE,
-                "user_agent": APPROVED_UA,
-                "login_url": login_url,
-                "hcp_url": hcp_url,
-                "headful": headful,
-                "slow_mo_ms": slow_mo_ms,
-                "timeout_ms": timeout_ms,
-            }
+    runtime = _playwright_runtime()
+    return (
+        runtime["executor"]
+        .submit(
+            _fetch_hcp_sorted_on_worker,
+            runtime,
+            login_url,
+            hcp_url,
+            username,
+            password,
+            diag,
+            headful,
+            slow_mo_ms,
+            timeout_ms,
+            ignore_https_errors,
+            save_snapshots,
         )
+        .result()
+    )
 
-        try:
-            # 1) Login oldal (csak belépéshez)
-            page.goto(login_url, wait_until="domcontentloaded")
-            # Zscaler unsupported browser blokkolás korai detektálása
-            try:
-                title = page.title()
-                html = page.content()
-                if ("Zscaler" in title) or ("this web browser is not approved" in html):
-                    diag["zscaler_block"] = {
-                        "engine": APPROVED_ENGINE,
-                        "user_agent": APPROVED_UA,
-                        "url": page.url,
-                    }
-                    raise RuntimeError(
-                        "Zscaler policy blokkolja a böngészőt/UA-t (unsupported browser)."
-                    )
-            except Exception:
-                pass
 
-            _try_accept_cookies(page, diag)
-            try:
-                page.wait_for_load_state("networkidle")
-            except PWTimeout:
-                pass
+def _fetch_hcp_sorted_on_worker(
+    runtime: dict,
+    login_url: str,
+    hcp_url: str,
+    username: str,
+    password: str,
+    diag: dict,
+    headful: bool,
+    slow_mo_ms: int,
+    timeout_ms: int,
+    ignore_https_errors: bool,
+    save_snapshots: bool,
+) -> Tuple[pd.DataFrame, Optional[str]]:
+    """A playwright_fetch_hcp_sorted törzse – a Playwright-szálon fut."""
+    ensure_snapshots_dir()
+    state_path = _storage_state_path()
+    ctx_kwargs = {"storage_state": state_path} if _state_is_fresh(state_path) else {}
+    browser = _get_browser(runtime, headful, slow_mo_ms)
+    context = browser.new_context(
+        locale="hu-HU",
+        user_agent=APPROVED_UA,
+        ignore_https_errors=ignore_https_errors,
+        **ctx_kwargs,
+    )
+    context.route("**/*", _block_heavy_requests)
+    page = context.new_page()
+    page.set_default_timeout(timeout_ms)
+    page.set_default_navigation_timeout(timeout_ms)
+
+    # Diagnosztika
+    diag.update(
+        {
+            "engine": APPROVED_ENGINE,
+            "user_agent": APPROVED_UA,
+            "login_url": login_url,
+            "hcp_url": hcp_url,
+            "headful": headful,
+            "slow_mo_ms": slow_mo_ms,
+            "timeout_ms": timeout_ms,
+        }
+    )
 
-            # Nem mentünk login oldal tartalmat – csak belépünk
-            frame = _select_frame_with_login(page, diag)
-            _fill_and_submit_login(frame, username, password, diag, timeout_ms)
+    try:
+        # Mentett session: egyből a HCP oldalra; ha visszadob a loginra, teljes belépés
+        session_reused = False
+        if "storage_state" in ctx_kwargs:
+            page.goto(hcp_url, wait_until="domcontentloaded", timeout=timeout_ms)
+            session_reused = "auth/login" not in page.url
+        diag["session_reused"] = session_reused
 
+        if not session_reused:
+            # 1) Login oldal (csak belépéshez)
+            _login(page, login_url, username, password, diag, timeout_ms)
             # 2) HCP oldal – CSAK innen olvasunk
             page.goto(hcp_url, wait_until="domcontentloaded", timeout=timeout_ms)
-            try:
-                page.wait_for_load_state("networkidle")
-            except PWTimeout:
-                pass
-
-            diag["post_login_url"] = page.url
-            login_ok = ("auth/login" not in page.url) or _looks_logged_in(page)
-            diag["login_ok"] = bool(login_ok)
+        # networkidle helyett: a táblázat adatsorára (vagy a visszadobó login űrlapra) várunk,
+        # a háttérben futó trackerek így nem húzzák ki az időkorlátig
+        try:
+            page.wait_for_selector(HCP_READY_SELECTOR, timeout=timeout_ms)
+        except PWTimeout:
+            pass
 
-            if not login_ok:
-                raise RuntimeError(
-                    "Sikertelen bejelentkezés – visszairányított a belépő oldalra vagy nincs belépett állapot."
-                )
+        diag["post_login_url"] = page.url
+        login_ok = ("auth/login" not in page.url) or _looks_logged_in(page)
+        diag["login_ok"] = bool(login_ok)
 
-            # HTML mentés csak a HCP oldalról (kérés szerint)
-            html = page.content()
+        if not login_ok:
+            raise RuntimeError(
+                "Sikertelen bejelentkezés – visszairányított a belépő oldalra vagy nincs belépett állapot."
+            )
+        if not session_reused:
+            # Friss belépés után a session sütik mentése a következő futásokhoz
+            context.storage_state(path=state_path)
+            os.chmod(state_path, 0o600)
+
+        # HTML mentés csak a HCP oldalról (kérés szerint) – sikeres futásnál csak debughoz
+        html = page.content()
+        if save_snapshots:
             save_html(os.path.join("snapshots", "hcp_playwright.html"), html)
-            page.screenshot(path=os.path.join("snapshots", "hcp.png"), full_page=True)
+            page.screenshot(
+                path=os.path.join("snapshots", "hcp.jpg"),
+                full_page=True,
+                type="jpeg",
+                quality=60,
+            )
 
-            # Táblázat kinyerés + rendezés
-            headers, rows = parse_first_table(html)
-            if not rows:
-                raise RuntimeError(
-                    "A HCP oldalon nem találtam adatsort tartalmazó táblát."
-                )
+        # Táblázat kinyerés + rendezés
+        df_sorted, dt_col = build_sorted_table(html)
+        if df_sorted.empty:
+            raise RuntimeError("A HCP oldalon nem találtam adatsort tartalmazó táblát.")
 
-            df_sorted, dt_col = detect_and_sort_by_datetime(headers, rows)
-            if dt_col:
-                diag["sorted_by"] = dt_col
-            else:
-                diag["sorted_by"] = None
+        if dt_col:
+            diag["sorted_by"] = dt_col
+        else:
+            diag["sorted_by"] = None
 
-            browser.close()
-            return df_sorted, dt_col
+        return df_sorted, dt_col
 
-        except Exception as e:
-            # Hiba esetén csak a hcp/error állapotot mentjük
-            try:
-                page.screenshot(
-                    path=os.path.join("snapshots", "error.png"), full_page=True
-                )
-                save_html(os.path.join("snapshots", "error_dom.html"), page.content())
-            except Exception:
-                pass
-            browser.close()
-            raise e
+    except Exception as e:
+        # Hiba esetén csak a hcp/error állapotot mentjük
+        try:
+            page.screenshot(path=os.path.join("snapshots", "error.png"), full_page=True)
+            save_html(os.path.join("snapshots", "error_dom.html"), page.content())
+        except Exception:
+            pass
+        raise e
+    finally:
+        context.close()
 
 
 # ============================ Streamlit UI ============================
@@ -448,6 +666,11 @@ with col0:
         value=False,
         help="Ha bejelölöd, látod a Playwright böngészőablakát.",
     )
+    save_snapshots = st.checkbox(
+        "Snapshotok mentése",
+        value=False,
+        help="Sikeres letöltésnél is elmenti a HCP oldal HTML-jét és képét (hiba esetén mindig).",
+    )
 with col1:
     slow_mo_ms = st.number_input(
         "Lassítás (ms)",
@@ -480,7 +703,6 @@ with colB:
 st.divider()
 btn_fetch = st.button("🔄 HCP letöltés + rendezés + mentés (CSV + SQLite)")
 
-df: Optional[pd.DataFrame] = None
 diagnostics: dict = {}
 
 try:
@@ -496,6 +718,7 @@ try:
                 slow_mo_ms=slow_mo_ms,
                 timeout_ms=timeout_ms,
                 ignore_https_errors=ignore_https_errors,
+                save_snapshots=save_snapshots,
             )
 
             # Jelzés a bejelentkezésről
@@ -526,19 +749,15 @@ try:
                     )
 
                 # CSV mentés
-                csv_bytes = df_sorted.to_csv(
-                    index=False, sep=";", encoding="utf-8"
-                ).encode("utf-8")
-                os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
-                with open(csv_path, "wb") as f:
-                    f.write(csv_bytes)
+                save_to_csv(df_sorted, csv_path)
                 st.success(f"📁 CSV elmentve: `{csv_path}`")
-                st.download_button(
-                    "📥 CSV letöltése",
-                    data=csv_bytes,
-                    file_name=os.path.basename(csv_path),
-                    mime="text/csv",
-                )
+                with open(csv_path, "rb") as f:
+                    st.download_button(
+                        "📥 CSV letöltése",
+                        data=f,
+                        file_name=os.path.basename(csv_path),
+                        mime="text/csv",
+                    )
 
                 # SQLite mentés
                 save_to_sqlite(df_sorted, db_path, table="hcp_records_sorted")
@@ -546,16 +765,20 @@ try:
                     f"🗄️ SQLite elmentve: `{db_path}`, tábla: `hcp_records_sorted`"
                 )
 
-                df = df_sorted
+                # Rerunok között is megmarad (különben a szűrőmező első gépelésekor eltűnne)
+                st.session_state["hcp_df"] = df_sorted
+                st.session_state["hcp_search"] = build_search_text(df_sorted)
 
     # Táblázat megjelenítés (ha van)
+    df = st.session_state.get("hcp_df")
     if df is not None and not df.empty:
         st.subheader("Rendezett HCP táblázat")
         q = st.text_input("Szűrés (részszó):", "")
         if q:
-            mask = pd.Series(False, index=df.index)
-            for c in df.columns:
-                mask = mask | df[c].astype(str).str.contains(q, case=False, na=False)
+            # Egyetlen C-szintű részszó-keresés az előre összefűzött sorokon
+            mask = st.session_state["hcp_search"].str.contains(
+                q.casefold(), na=False, regex=False
+            )
             st.dataframe(df[mask], use_container_width=True, height=480)
         else:
             st.dataframe(df, use_container_width=True, height=480)
@@ -567,7 +790,7 @@ try:
         st.subheader("Diagnosztika")
         st.code(json.dumps(diagnostics, indent=2, ensure_ascii=False))
         st.caption(
-            "Snapshotok: ./snapshots/hcp_playwright.html, hcp.png, (hiba esetén) error.png/error_dom.html"
+            "Snapshotok: ./snapshots/hcp_playwright.html, hcp.jpg (ha bekapcsoltad), (hiba esetén) error.png/error_dom.html"
         )
 
 except PWTimeout as e:
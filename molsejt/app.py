@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Dict, Optional
+from typing import List, Dict, Mapping, Optional, Sequence, Tuple
 from pathlib import Path
 import json
 import io
@@ -7,8 +7,13 @@ import csv
 import os
 import streamlit as st
 
+try:
+    import orjson
+except ImportError:  # opcionális gyorsítás; nélküle a stdlib json-t használjuk
+    orjson = None
+
 # Kérdésválogatás és CSV beolvasás – győződj meg róla, hogy qa_utils.py ugyanebben a mappában van.
-from qa_utils import valassz_forras_es_kerdesek
+from qa_utils import beolvas_csv_dict, valassz_betoltott_forrasbol
 
 # ─────────────────────────────────────────────────────────
 # Mindig az app fájlja MELLŐL dolgozunk, függetlenül a CWD-től
@@ -20,6 +25,32 @@ PASS_MIN: int = 9  # legalább ennyi helyes kell a sikerhez (12-ből 9)
 FAJL_1: Path = APP_DIR / "kerdes_valaszok.csv"  # 1. félév
 FAJL_2: Path = APP_DIR / "kerdes_valaszok2.csv"  # 2. félév
 SEED: Optional[int] = None  # pl. 42 a reprodukálhatósághoz, különben None
+_MOD_LABELS: Dict[str, str] = {
+    "1": "1. félév",
+    "2": "2. félév",
+    "szigorlat": "3. szigorlat (50–50%)",
+}
+
+
+# Fájl-létezés ellenőrzése: a stat() hívás percenként legfeljebb egyszer fut
+@st.cache_data(ttl=60, show_spinner=False)
+def _csv_exists(p: str) -> bool:
+    return Path(p).exists()
+
+
+# CSV beolvasás folyamatonként egyszer; az mtime a kulcsban, így módosításkor újratölt.
+# A kérdéslista (mintavételi készlet) is itt készül el, nem minden generálásnál.
+@st.cache_resource(show_spinner=False)
+def _load_source(
+    path: str, mtime_ns: int
+) -> Tuple[Dict[str, List[str]], Tuple[str, ...]]:
+    qa = beolvas_csv_dict(path)
+    return qa, tuple(qa)
+
+
+def _source(p: Path) -> Tuple[Dict[str, List[str]], Tuple[str, ...]]:
+    return _load_source(str(p), p.stat().st_mtime_ns)
+
 
 st.set_page_config(
     page_title="Molekuláris sejtbiológia – minimum kérdések teszt",
@@ -31,28 +62,27 @@ st.set_page_config(
 st.sidebar.header("Beállítás")
 mod = st.sidebar.selectbox(
     "Vizsga típusa",
-    options=["1", "2", "szigorlat"],
-    format_func=lambda x: {
-        "1": "1. félév",
-        "2": "2. félév",
-        "szigorlat": "3. szigorlat (50–50%)",
-    }[x],
+    options=list(_MOD_LABELS),
+    format_func=_MOD_LABELS.__getitem__,
 )
 start = st.sidebar.button("🎯 Generálás / újrakeverés")
 
+f1_ok = _csv_exists(str(FAJL_1))
+f2_ok = _csv_exists(str(FAJL_2))
+
 # Diagnosztika – lásd, honnan fut és mit lát
 with st.sidebar.expander("Diagnosztika", expanded=False):
     st.write(f"**CWD**: {os.getcwd()}")
     st.write(f"**__file__**: {__file__}")
     st.write(f"**APP_DIR**: {APP_DIR}")
-    st.write(f"**{FAJL_1.name}** exists? {FAJL_1.exists()}")
-    st.write(f"**{FAJL_2.name}** exists? {FAJL_2.exists()}")
+    st.write(f"**{FAJL_1.name}** exists? {f1_ok}")
+    st.write(f"**{FAJL_2.name}** exists? {f2_ok}")
 
 # Rövid összegzés a fájlokról
 st.sidebar.caption(f"📂 Aktív app-könyvtár: `{APP_DIR}`")
 st.sidebar.write(
-    f"- 1. félév: `{FAJL_1.name}` — **{'OK' if FAJL_1.exists() else 'HIÁNYZIK'}**\n"
-    f"- 2. félév: `{FAJL_2.name}` — **{'OK' if FAJL_2.exists() else 'HIÁNYZIK'}**"
+    f"- 1. félév: `{FAJL_1.name}` — **{'OK' if f1_ok else 'HIÁNYZIK'}**\n"
+    f"- 2. félév: `{FAJL_2.name}` — **{'OK' if f2_ok else 'HIÁNYZIK'}**"
 )
 
 # ─────────────────────────────────────────────────────────
@@ -67,6 +97,11 @@ if "itel" not in st.session_state:
     st.session_state.itel = {}  # Dict[str, Optional[str]]
 if "osszegzes" not in st.session_state:
     st.session_state.osszegzes = None  # Optional[Dict[str, object]]
+# Futó számlálók az itel-hez: ítélet-váltáskor frissülnek, nem kell minden rerunnál végigszámolni
+if "helyes_db" not in st.session_state:
+    st.session_state.helyes_db = 0
+if "itelt_db" not in st.session_state:
+    st.session_state.itelt_db = 0
 
 
 # ─────────────────────────────────────────────────────────
@@ -74,9 +109,9 @@ if "osszegzes" not in st.session_state:
 def generalj() -> None:
     # Előzetes ellenőrzés – egyértelmű üzenet a hiányzó fájlokra
     missing = []
-    if mod in ("1", "szigorlat") and not FAJL_1.exists():
+    if mod in ("1", "szigorlat") and not _csv_exists(str(FAJL_1)):
         missing.append(str(FAJL_1))
-    if mod in ("2", "szigorlat") and not FAJL_2.exists():
+    if mod in ("2", "szigorlat") and not _csv_exists(str(FAJL_2)):
         missing.append(str(FAJL_2))
     if missing:
         st.error(
@@ -88,8 +123,10 @@ def generalj() -> None:
         return  # extra védelem
 
     try:
-        kerdesek, qa = valassz_forras_es_kerdesek(
-            mod=mod, n=THRESHOLD, fajl_1=str(FAJL_1), fajl_2=str(FAJL_2), seed=SEED
+        qa1, kulcsok1 = _source(FAJL_1) if mod in ("1", "szigorlat") else (None, None)
+        qa2, kulcsok2 = _source(FAJL_2) if mod in ("2", "szigorlat") else (None, None)
+        kerdesek, qa = valassz_betoltott_forrasbol(
+            mod, THRESHOLD, qa1, qa2, SEED, kulcsok1, kulcsok2
         )
     except Exception as e:
         st.error(f"Hiba a kérdések előkészítése során: {e}")
@@ -99,11 +136,23 @@ def generalj() -> None:
         # Csak sikeres beolvasás után állítsunk állapotot
         st.session_state.kerdesek = kerdesek
         st.session_state.qa = qa
-        st.session_state.show_answer = {k: False for k in kerdesek}
-        st.session_state.itel = {k: None for k in kerdesek}
+        st.session_state.show_answer = dict.fromkeys(kerdesek, False)
+        st.session_state.itel = dict.fromkeys(kerdesek, None)
+        st.session_state.helyes_db = 0
+        st.session_state.itelt_db = 0
         st.session_state.osszegzes = None
 
 
+def itelet_beallit(k: str, uj: Optional[str]) -> None:
+    """Beírja az ítéletet, és csak a változás irányában lépteti a számlálókat."""
+    regi = st.session_state.itel.get(k)
+    if regi == uj:
+        return
+    st.session_state.itel[k] = uj
+    st.session_state.itelt_db += (uj is not None) - (regi is not None)
+    st.session_state.helyes_db += (uj == "helyes") - (regi == "helyes")
+
+
 # Első betöltéskor, vagy gombnyomásra töltsünk
 if start or not st.session_state.kerdesek:
     generalj()
@@ -112,7 +161,7 @@ if start or not st.session_state.kerdesek:
 # Fejléc és státusz
 st.title("🧬 Molekuláris sejtbiológia – minimum kérdések teszt")
 st.caption(
-    f"Egyszerre látszik minden kérdés. Mód: **{{'1':'1. félév','2':'2. félév','szigorlat':'3. szigorlat (50–50%)'}}[mod]** • "
+    f"Egyszerre látszik minden kérdés. Mód: **{_MOD_LABELS[mod]}** • "
     f"Kérdések száma: **{THRESHOLD}** • Sikeresség feltétele: **legalább {PASS_MIN} helyes**."
 )
 
@@ -128,16 +177,12 @@ qa = st.session_state.qa
 show_answer = st.session_state.show_answer
 itel = st.session_state.itel
 
-itelt_db = sum(1 for k in kerdesek if itel.get(k) in ("helyes", "hibas"))
-helyes_db = sum(1 for k in kerdesek if itel.get(k) == "helyes")
-
 c1, c2, c3, c4 = st.columns([1, 1, 1, 2])
 with c1:
     st.metric("Kérdések száma", len(kerdesek))
-with c2:
-    st.metric("Önértékelt", f"{itelt_db}/{len(kerdesek)}")
-with c3:
-    st.metric("Helyesnek jelölt", helyes_db)
+# Az önértékelési számlálók helye; a kérdések után töltjük ki, amikor már frissek
+itelt_hely = c2.empty()
+helyes_hely = c3.empty()
 with c4:
     st.button(
         "🔁 Újrakeverés (ugyanennyi kérdés)",
@@ -154,48 +199,57 @@ def show_answers_markdown(ans_list: List[str]) -> None:
     if not ans_list:
         st.caption("(Nincs válasz rögzítve)")
         return
+    # Egyetlen markdown-elem az összes válaszra (soronkénti st.markdown/st.code helyett)
+    reszek: List[str] = []
     for i, a in enumerate(ans_list, 1):
         text = str(a).strip()
         if "\n" in text:
-            st.markdown(f"**{i})**")
-            st.code(text)
+            reszek.append(f"**{i})**\n\n```\n{text}\n```")
         else:
-            st.markdown(f"**{i})** {text}")
+            reszek.append(f"**{i})** {text}")
+    st.markdown("\n\n".join(reszek))
+
+
+# Kérdéskártya HTML-sablonja – egyszer épül fel, a ciklus csak kitölti
+_CARD_TPL = (
+    "{hr}\n"
+    '<div style="border:1px solid #ddd;border-radius:8px;padding:16px;background:{bg}">\n'
+    '  <div style="font-weight:600;">{n}. kérdés</div>\n'
+    '  <div style="margin-top:6px;">{q}</div>\n'
+    "</div>"
+)
+_MARK_BG = {"helyes": "#eaffea", "hibas": "#ffecec"}
+
+
+def _reveal(kk: str) -> None:
+    st.session_state.show_answer[kk] = True
 
 
 # ─────────────────────────────────────────────────────────
 # Kérdésblokkok – „Válasz megjelenítése” + önértékelés
-for sorszam, k in enumerate(kerdesek, start=1):
-    bg = (
-        "#eaffea"
-        if itel.get(k) == "helyes"
-        else ("#ffecec" if itel.get(k) == "hibas" else "#ffffff")
-    )
-    st.markdown(
-        f"""
-        <div style="border:1px solid #ddd;border-radius:8px;padding:16px;background:{bg}">
-          <div style="font-weight:600;">{sorszam}. kérdés</div>
-          <div style="margin-top:6px;">{k}</div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+def _render_question(sorszam: int, k: str) -> None:
+    mark = st.session_state.itel.get(k)
+    shown = st.session_state.show_answer.get(k, False)
+    bg = _MARK_BG.get(mark, "#ffffff")
+    # Az előző kérdéstől elválasztó vonal is a kártya HTML-jében van (nincs külön elem)
+    hr = "<hr>" if sorszam > 1 else ""
+    st.markdown(_CARD_TPL.format(hr=hr, bg=bg, n=sorszam, q=k), unsafe_allow_html=True)
 
     cA, cB = st.columns([1, 3])
     with cA:
         st.button(
             "👀 Válasz megjelenítése",
             key=f"btn_show_{sorszam}",
-            on_click=lambda kk=k: show_answer.__setitem__(kk, True),
+            on_click=_reveal,
+            args=(k,),
             use_container_width=True,
         )
     with cB:
-        if show_answer.get(k, False):
+        if shown:
             st.success("Elfogadható válasz(ok):")
-            show_answers_markdown(qa.get(k, []))
+            show_answers_markdown(st.session_state.qa.get(k, []))
 
-            current = itel.get(k)
-            radio_idx = 0 if (current is None or current == "helyes") else 1
+            radio_idx = 0 if (mark is None or mark == "helyes") else 1
             val = st.radio(
                 "Önértékelés:",
                 options=["Helyesnek ítélem", "Nem volt helyes"],
@@ -203,19 +257,52 @@ for sorszam, k in enumerate(kerdesek, start=1):
                 key=f"radio_{sorszam}",
                 horizontal=True,
             )
-            itel[k] = "helyes" if val == "Helyesnek ítélem" else "hibas"
+            itelet_beallit(k, "helyes" if val == "Helyesnek ítélem" else "hibas")
         else:
             st.info(
                 "Kattints a „Válasz megjelenítése” gombra, és utána értékeld a válaszodat."
             )
 
-    st.write("---")
+
+for sorszam, k in enumerate(kerdesek, start=1):
+    _render_question(sorszam, k)
+
+helyes_db = st.session_state.helyes_db
+itelt_db = st.session_state.itelt_db
+itelt_hely.metric("Önértékelt", f"{itelt_db}/{len(kerdesek)}")
+helyes_hely.metric("Helyesnek jelölt", helyes_db)
+
+st.write("---")
+
+
+# ─────────────────────────────────────────────────────────
+# JSON export bájtjai
+def export_reszletek(
+    kerdesek: Sequence[str], qa: Mapping[str, Sequence[str]], itel: Mapping[str, object]
+) -> Tuple[Dict[str, object], ...]:
+    # Egyetlen tuple, amit a szerializáló (orjson / json) közvetlenül listaként ír ki
+    return tuple(
+        {"kerdes": k, "elfogadhato_valaszok": qa.get(k, []), "itel": itel.get(k)}
+        for k in kerdesek
+    )
+
+
+def export_json_bytes(export: Dict[str, object]) -> bytes:
+    if orjson is not None:
+        # orjson: C-ben szerializál, és eleve UTF-8 bájtokat ad vissza
+        return orjson.dumps(export, option=orjson.OPT_INDENT_2)
+    # json.dump közvetlenül bájt-pufferbe ír: nincs külön teljes str + bytes másolat
+    buf = io.BytesIO()
+    szoveg = io.TextIOWrapper(buf, encoding="utf-8", write_through=True)
+    json.dump(export, szoveg, ensure_ascii=False, indent=2)
+    szoveg.detach()  # a wrapper ne zárja be a puffert
+    return buf.getvalue()
 
 
 # ─────────────────────────────────────────────────────────
 # Kiértékelés (12-ből legalább 9 helyes)
 def kiertet() -> None:
-    helyes = sum(1 for k in kerdesek if itel.get(k) == "helyes")
+    helyes = st.session_state.helyes_db
     sikeres = helyes >= PASS_MIN
     st.session_state.osszegzes = {"helyes_db": helyes, "sikeres": sikeres}
 
@@ -239,32 +326,43 @@ if st.session_state.osszegzes is not None:
         "minimum_helyes": PASS_MIN,
         "helyes_db": helyes,
         "sikeres": sikeres,
-        "reszletek": [
-            {"kerdes": k, "elfogadhato_valaszok": qa.get(k, []), "itel": itel.get(k)}
-            for k in kerdesek
-        ],
+        "reszletek": export_reszletek(kerdesek, qa, itel),
     }
     st.download_button(
         label="📥 Eredmények letöltése (JSON)",
-        data=json.dumps(export, ensure_ascii=False, indent=2).encode("utf-8"),
+        data=export_json_bytes(export),
         file_name="molek_sejtbiologia_eredmeny.json",
         mime="application/json",
         use_container_width=True,
     )
 
-# CSV export
-buf = io.StringIO()
-w = csv.writer(buf)
-w.writerow(["index", "question", "mark", "answers"])
-for i, kk in enumerate(kerdesek, 1):
-    mark = itel.get(kk)
-    mark_str = "" if mark is None else ("correct" if mark == "helyes" else "wrong")
-    joined = " | ".join(str(a).replace("\n", " ") for a in qa.get(kk, []))
-    w.writerow([i, kk, mark_str, joined])
-st.download_button(
-    label="⬇️ Eredmények letöltése (CSV)",
-    data=buf.getvalue(),
-    file_name="molek_sejtbiologia_eredmeny.csv",
-    mime="text/csv",
-    use_container_width=True,
-)
+
+# CSV export – csak kérésre épül fel, nem minden rerunnál
+_NL_TBL = str.maketrans({"\n": " ", "\r": " "})  # sortörés → szóköz (egy menetben)
+
+
+def _csv_rows():
+    for i, kk in enumerate(kerdesek, 1):
+        mark = itel.get(kk)
+        mark_str = "" if mark is None else ("correct" if mark == "helyes" else "wrong")
+        joined = " | ".join(str(a).translate(_NL_TBL) for a in qa.get(kk, []))
+        yield (i, kk, mark_str, joined)
+
+
+def _build_csv() -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["index", "question", "mark", "answers"])
+    w.writerows(_csv_rows())
+    return buf.getvalue()
+
+
+if st.button("📄 CSV export előkészítése", use_container_width=True):
+    st.download_button(
+        label="⬇️ Eredmények letöltése (CSV)",
+        data=_build_csv(),
+        file_name="molek_sejtbiologia_eredmeny.csv",
+        mime="text/csv",
+        on_click="ignore",  # letöltéskor ne fusson újra az app (a gomb látható marad)
+        use_container_width=True,
+    )
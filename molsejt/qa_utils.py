@@ -1,25 +1,29 @@
 from __future__ import annotations
 import csv
+import functools
+import itertools
 import re
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import random
 import math
 
+# Előre fordított minták (soronként / cellánként futnak a beolvasásnál)
+_BULLET_MULTI_RE = re.compile(r"(?m)^\s*\-\s+")
+_INLINE_HYPHEN_RE = re.compile(r"\s-\s+")
 
-def _detect_csv_dialect(path: Path) -> Optional[csv.Dialect]:
-    """CSV dialektus autodetekció; hiba esetén None."""
-    with open(path, "r", encoding="utf-8-sig", newline="") as f:
-        sample = f.read(4096)
-        try:
-            return csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
-        except csv.Error:
-            return None
+
+def _bullet_tartalom(ln: str) -> Optional[str]:
+    """Sor eleji '- ' bullet tartalma, vagy None (regex nélkül: '^\\s*-\\s+(.*)')."""
+    s = ln.lstrip()
+    if s[:1] == "-" and s[1:2].isspace():
+        return s[1:].lstrip()
+    return None
 
 
-def _find_column(row: dict, *candidates: str) -> Optional[str]:
-    """Megkeresi a megadott oszlopnevek egyikét a row kulcsai között (case-insensitive)."""
-    lower_map = {k.strip().lower(): k for k in row.keys() if isinstance(k, str)}
+def _find_column(fieldnames: Iterable[str], *candidates: str) -> Optional[str]:
+    """Megkeresi a megadott oszlopnevek egyikét a fejlécnevek között (case-insensitive)."""
+    lower_map = {k.strip().lower(): k for k in fieldnames if isinstance(k, str)}
     for cand in candidates:
         if cand in lower_map:
             return lower_map[cand]
@@ -33,20 +37,20 @@ def _split_line_bullets_multiline(text: str) -> List[str]:
     """Sor eleji '- ' bulletok szerinti több soros bontás."""
     if not text.strip():
         return []
-    if not re.search(r"(?m)^\s*\-\s+", text):
+    if "-" not in text or not _BULLET_MULTI_RE.search(text):
         return []
     lines = text.splitlines()
     answers: List[str] = []
     current: List[str] = []
     in_bullet = False
     for ln in lines:
-        m = re.match(r"^\s*\-\s+(.*)", ln)
-        if m:
+        tartalom = _bullet_tartalom(ln)
+        if tartalom is not None:
             if current:
                 answers.append("\n".join(current).rstrip())
                 current = []
             in_bullet = True
-            current.append(m.group(1))
+            current.append(tartalom)
         else:
             if in_bullet:
                 current.append(ln.rstrip())
@@ -60,8 +64,9 @@ def _split_inline_hyphen_semicolon(text: str) -> List[str]:
     s = (text or "").strip()
     if not s:
         return []
-    if re.search(r"\s-\s+", s):
-        parts = re.split(r"\s-\s+", s)
+    # Olcsó előszűrés: kötőjel nélkül a regexet sem kell futtatni
+    if "-" in s and _INLINE_HYPHEN_RE.search(s):
+        parts = _INLINE_HYPHEN_RE.split(s)
         return [p.strip(" ;") for p in parts if p.strip(" ;")]
     if ";" in s:
         parts = s.split(";")
@@ -79,7 +84,10 @@ def _answers_from_cell(cell: Optional[str]) -> List[str]:
     """
     if cell is None:
         return []
-    txt = cell.replace("\r\n", "\n").replace("\r", "\n").strip()
+    # newline="" miatt a CSV cellában maradhat \r; csak akkor normalizálunk, ha van
+    if "\r" in cell:
+        cell = cell.replace("\r\n", "\n").replace("\r", "\n")
+    txt = cell.strip()
     bullets = _split_line_bullets_multiline(txt)
     if bullets:
         return bullets
@@ -89,64 +97,100 @@ def _answers_from_cell(cell: Optional[str]) -> List[str]:
     return [txt] if txt else []
 
 
+def _egyedi_valaszok(cel: Dict[str, str], valaszok: Sequence[str]) -> None:
+    """A kisbetűs, levágott alak szerint új válaszokat fűz a ``cel`` dicthez (az első írásmód marad)."""
+    for ans in valaszok:
+        a = ans.strip()
+        key = a.lower()
+        if key:
+            cel.setdefault(key, a)
+
+
+def _beolvas_csv_nyers(path: Path) -> Dict[str, List[str]]:
+    qa: Dict[str, List[str]] = {}
+    # duplikált kérdésekhez: normalizált kulcs -> első írásmód, beillesztési sorrendben
+    osszevont: Dict[str, Dict[str, str]] = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        # A sorokat folyamban dolgozzuk fel (nincs list(reader) másolat);
+        # az első sort csak az üres fájl felismeréséhez vesszük előre.
+        reader = csv.DictReader(f, dialect=csv.excel)
+        elso = next(reader, None)
+        if elso is None:
+            raise ValueError("A CSV üresnek tűnik.")
+
+        q_col = _find_column(reader.fieldnames, "question", "questions")
+        a_col = _find_column(reader.fieldnames, "answer", "answers")
+        if q_col is None or a_col is None:
+            raise KeyError("A CSV nem tartalmaz 'question' és 'answer' fejlécet.")
+
+        for row in itertools.chain((elso,), reader):
+            question = (row.get(q_col, "") or "").strip()
+            answer_raw = row.get(a_col, "") or ""
+            if not question:
+                continue
+            answers = _answers_from_cell(answer_raw)
+            # duplikált kérdések esetén egyesítjük az egyedi válaszokat
+            if question in qa:
+                egyedi = osszevont.get(question)
+                if egyedi is None:
+                    egyedi = osszevont[question] = {}
+                    _egyedi_valaszok(egyedi, qa[question])
+                _egyedi_valaszok(egyedi, answers)
+            else:
+                qa[question] = answers
+    for question, egyedi in osszevont.items():
+        qa[question] = list(egyedi.values())
+
+    if not qa:
+        raise ValueError("Nem sikerült kérdés–válasz párokat beolvasni a CSV-ből.")
+    return qa
+
+
+# --- Beolvasott Q&A gyorsítótár (folyamaton belül, lru_cache) ---
+# A kulcs a fájl mtime-ja és mérete, így a CSV módosításakor automatikusan újraolvasunk.
+
+
+@functools.lru_cache(maxsize=4)
+def _beolvas_cachelt(filename: str, mtime_ns: int, size: int) -> Dict[str, List[str]]:
+    return _beolvas_csv_nyers(Path(filename))
+
+
 def beolvas_csv_dict(filename: str) -> Dict[str, List[str]]:
     """
-    Beolvasás 'question,answer' CSV-ből:
+    Beolvasás 'question,answer' CSV-ből (UTF-8, opcionális BOM; rögzített
+    csv.excel dialektus: ',' elválasztó, '"' idézőjel – nincs csv.Sniffer):
     - 'question' oszlop: a kérdés (ahogy van),
     - 'answer' oszlop: válaszok bontása ';' és ' - ' szeparátorok szerint,
       sor eleji '-' bulletok többsoros blokkot képeznek, a '/' nem bont.
     Visszaad: { kérdés: [válasz1, válasz2, ...] }
+    A beolvasott eredmény cache-elődik (lásd _beolvas_cachelt).
     """
     path = Path(filename)
     if not path.exists():
         raise FileNotFoundError(f"Nem található a fájl: {path.resolve()}")
-
-    dialect = _detect_csv_dialect(path)
-    with open(path, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f, dialect=dialect) if dialect else csv.DictReader(f)
-        rows = list(reader)
-
-    if not rows:
-        raise ValueError("A CSV üresnek tűnik.")
-
-    q_col = _find_column(rows[0], "question", "questions")
-    a_col = _find_column(rows[0], "answer", "answers")
-    if q_col is None or a_col is None:
-        raise KeyError("A CSV nem tartalmaz 'question' és 'answer' fejlécet.")
-
-    qa: Dict[str, List[str]] = {}
-    for row in rows:
-        question = (row.get(q_col, "") or "").strip()
-        answer_raw = row.get(a_col, "") or ""
-        if not question:
-            continue
-        answers = _answers_from_cell(answer_raw)
-        # duplikált kérdések esetén egyesítjük az egyedi válaszokat
-        if question in qa:
-            merged = qa[question] + answers
-            seen = set()
-            uniq: List[str] = []
-            for ans in merged:
-                key = ans.strip().lower()
-                if key and key not in seen:
-                    seen.add(key)
-                    uniq.append(ans.strip())
-            qa[question] = uniq
-        else:
-            qa[question] = answers
-
-    if not qa:
-        raise ValueError("Nem sikerült kérdés–válasz párokat beolvasni a CSV-ből.")
-    return qa
+    st = path.stat()
+    qa = _beolvas_cachelt(str(path.resolve()), st.st_mtime_ns, st.st_size)
+    # Friss másolat: a hívó módosíthatja anélkül, hogy a cache-t elrontaná
+    return {q: list(a) for q, a in qa.items()}
 
 
-def valassz_kerdeseket(qa: Dict[str, List[str]], n: int = 12) -> List[str]:
-    """Véletlenszerűen kiválaszt n egyedi kérdést."""
+def valassz_kerdeseket(
+    qa: Dict[str, List[str]],
+    n: int = 12,
+    rng: random.Random | None = None,
+    kulcsok: Sequence[str] | None = None,
+) -> List[str]:
+    """
+    Véletlenszerűen kiválaszt n egyedi kérdést.
+    rng: saját véletlenszám-generátor (alapból a modul-szintű random);
+    kulcsok: előre elkészített kérdéslista (különben qa kulcsaiból épül).
+    """
     if n > len(qa):
         raise ValueError(
             "Nagyobb számot adtál meg, mint ahány kérdés rendelkezésre áll."
         )
-    return random.sample(list(qa.keys()), n)
+    pool = kulcsok if kulcsok is not None else list(qa.keys())
+    return (rng or random).sample(pool, n)
 
 
 # --- ÚJ: forrás kiválasztása és kevert mintavétel (1., 2. félév, szigorlat) ---
@@ -175,6 +219,13 @@ def _osszefesul_qa(*qadictok: Dict[str, List[str]]) -> Dict[str, List[str]]:
     return vegyes
 
 
+def _norm_mod(mod: str) -> str:
+    mod_norm = (mod or "").strip().lower()
+    if mod_norm not in {"1", "2", "3", "szigorlat"}:
+        raise ValueError("Érvénytelen mód. Használd: '1', '2' vagy '3/szigorlat'.")
+    return mod_norm
+
+
 def valassz_forras_es_kerdesek(
     mod: str,
     n: int = 12,
@@ -196,38 +247,54 @@ def valassz_forras_es_kerdesek(
     Visszatérés:
       (kiválasztott_kérdések_listája, teljes_forrás_qa_dict)
     """
-    if seed is not None:
-        random.seed(seed)
+    mod_norm = _norm_mod(mod)
+    qa1 = beolvas_csv_dict(fajl_1) if mod_norm != "2" else None
+    qa2 = beolvas_csv_dict(fajl_2) if mod_norm != "1" else None
+    return valassz_betoltott_forrasbol(mod_norm, n, qa1, qa2, seed=seed)
 
-    mod_norm = (mod or "").strip().lower()
-    if mod_norm not in {"1", "2", "3", "szigorlat"}:
-        raise ValueError("Érvénytelen mód. Használd: '1', '2' vagy '3/szigorlat'.")
+
+def valassz_betoltott_forrasbol(
+    mod: str,
+    n: int,
+    qa1: Optional[Dict[str, List[str]]],
+    qa2: Optional[Dict[str, List[str]]],
+    seed: int | None = None,
+    kulcsok1: Sequence[str] | None = None,
+    kulcsok2: Sequence[str] | None = None,
+) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Mint valassz_forras_es_kerdesek, de már beolvasott forrásokból mintavételez
+    (a hívó cache-elheti a CSV-k beolvasását). A módhoz nem szükséges forrás None lehet.
+    kulcsok1/kulcsok2: a források előre elkészített kérdéslistái (opcionális).
+    """
+    # Saját generátor seed esetén: ugyanaz a sorozat, mint random.seed(seed) után,
+    # de a globális állapot érintetlen marad
+    rng = random.Random(seed) if seed is not None else None
+
+    mod_norm = _norm_mod(mod)
 
     if n <= 0:
         raise ValueError("Az n legyen pozitív egész.")
 
     if mod_norm == "1":
-        qa = beolvas_csv_dict(fajl_1)
+        qa = qa1
         if n > len(qa):
             raise ValueError(
                 "Nagyobb n-t adtál meg, mint amennyi kérdés az 1. félévben van."
             )
-        kerd = valassz_kerdeseket(qa, n)
+        kerd = valassz_kerdeseket(qa, n, rng=rng, kulcsok=kulcsok1)
         return kerd, qa
 
     if mod_norm == "2":
-        qa = beolvas_csv_dict(fajl_2)
+        qa = qa2
         if n > len(qa):
             raise ValueError(
                 "Nagyobb n-t adtál meg, mint amennyi kérdés a 2. félévben van."
             )
-        kerd = valassz_kerdeseket(qa, n)
+        kerd = valassz_kerdeseket(qa, n, rng=rng, kulcsok=kulcsok2)
         return kerd, qa
 
     # "3" vagy "szigorlat": 50-50% a két fájlból
-    qa1 = beolvas_csv_dict(fajl_1)
-    qa2 = beolvas_csv_dict(fajl_2)
-
     # 50-50%: páratlan n esetén +1 megy az első forrásra
     n1 = math.ceil(n / 2)
     n2 = n - n1
@@ -237,10 +304,10 @@ def valassz_forras_es_kerdesek(
             f"Nem kérhető {n} kérdés 50–50%-ban: 1. félévben {len(qa1)}, 2. félévben {len(qa2)} elérhető."
         )
 
-    kerd1 = valassz_kerdeseket(qa1, n1)
-    kerd2 = valassz_kerdeseket(qa2, n2)
+    kerd1 = valassz_kerdeseket(qa1, n1, rng=rng, kulcsok=kulcsok1)
+    kerd2 = valassz_kerdeseket(qa2, n2, rng=rng, kulcsok=kulcsok2)
     kivalasztott = kerd1 + kerd2
-    random.shuffle(kivalasztott)
+    (rng or random).shuffle(kivalasztott)
 
     # Teljes QA-t is visszaadjuk (egyesítve), hogy a kérdéshez tartozó válaszok elérhetők legyenek
     qa_egyesitett = _osszefesul_qa(qa1, qa2)
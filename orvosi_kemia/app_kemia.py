@@ -1,13 +1,25 @@
 from __future__ import annotations
+import io
 import json
 import os
-import re
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
-import tempfile
+from types import MappingProxyType
+from typing import List, Mapping, Sequence
 
 import streamlit as st
-from qa_utils_kemia import beolvas_csv_dict, valassz_kerdeseket
+from PIL import Image as PILImage
+from qa_utils_kemia import (
+    beolvas_csv_dict,
+    beolvas_csv_szovegbol,
+    extract_qnum,
+    valassz_kerdeseket,
+)
+
+try:
+    import orjson
+except ImportError:  # opcionális gyorsítás; nélküle a stdlib json-t használjuk
+    orjson = None
 
 # ─────────────────────────────────────────────────────────
 # Stabil útvonalkezelés és fallback-ek
@@ -53,7 +65,7 @@ KUSZOB = 7
 
 # ─────────────────────────────────────────────────────────
 # Segédfüggvények
-def expand_answers(ans_list: list[str]) -> list[str]:
+def expand_answers(ans_list: Sequence[str]) -> list[str]:
     out: list[str] = []
     for a in ans_list:
         s = a or ""
@@ -63,25 +75,37 @@ def expand_answers(ans_list: list[str]) -> list[str]:
             out.append(s)
         else:
             if "," in s or ";" in s:
-                parts = [p.strip() for p in re.split(r"[;,]", s) if p.strip()]
+                # Egykarakteres elválasztók: str.split gyorsabb a regexnél
+                parts = [p.strip() for p in s.replace(";", ",").split(",") if p.strip()]
                 out.extend(parts)
             else:
                 out.append(s.strip())
 
-    seen = set()
-    uniq: list[str] = []
+    # Kis-/nagybetű-független dedup, az első előfordulás alakját és sorrendjét megtartva
+    elso: dict[str, str] = {}
     for p in out:
-        key = p.lower()
-        if key not in seen:
-            seen.add(key)
-            uniq.append(p)
-    return uniq
+        elso.setdefault(p.lower(), p)
+    return list(elso.values())
+
+
+def answers_bulleted_md(ans_list: Sequence[str]) -> str:
+    # Tuple-kulcs: a kész markdown rerunok között is cache-ből jön
+    return _answers_bulleted_md_cached(tuple(ans_list))
+
+
+@st.cache_data(show_spinner=False)
+def _answers_bulleted_md_cached(ans_tuple: tuple[str, ...]) -> str:
+    return answers_md_epit(ans_tuple)
 
 
-def answers_bulleted_md(ans_list: list[str]) -> str:
+def answers_md_epit(ans_list: Sequence[str]) -> str:
+    # Cache nélküli építés (a betöltéskori előrenderelés közvetlenül ezt hívja)
     items = expand_answers(ans_list)
-    lines: list[str] = []
+    # Gyakori eset: csupa egysoros válasz – egyetlen join, elágazások nélkül
+    if not any("\n" in item for item in items):
+        return "\n".join(f"- {item}" for item in items)
 
+    lines: list[str] = []
     for item in items:
         if "\n" not in item:
             lines.append(f"- {item}")
@@ -105,31 +129,149 @@ def answers_bulleted_md(ans_list: list[str]) -> str:
     return "\n".join(lines)
 
 
-def extract_qnum(kerdes: str) -> str | None:
-    m = re.match(r"^\s*(\d+)\.", kerdes)
-    return m.group(1) if m else None
+_KEP_KITERJESZTESEK = (".png", ".jpg", ".jpeg")
+
+
+def _dir_key(path: Path) -> tuple[str, int]:
+    # Cache-kulcs a képkönyvtárhoz: (útvonal, mtime_ns) – új/törölt képnél új index épül
+    try:
+        return str(path), path.stat().st_mtime_ns
+    except OSError:
+        return str(path), 0
+
+
+@st.cache_resource(show_spinner=False)
+def _kep_index(dir_str: str, mtime_ns: int) -> Mapping[str, tuple[Path, ...]]:
+    """
+    Egyetlen könyvtárlistázásból: sorszám -> képek, ugyanabban a sorrendben, mint a
+    korábbi exists()/glob hívások ('N.png', 'N.jpg', 'N.jpeg', majd 'N_*' kiterjesztésenként névsorban).
+    """
+    try:
+        nevek = os.listdir(dir_str)
+    except OSError:
+        return MappingProxyType({})
+    fo: dict[str, dict[str, str]] = {}
+    extra: dict[str, dict[str, list[str]]] = {}
+    for nev in nevek:
+        tors, ext = os.path.splitext(nev)
+        if ext not in _KEP_KITERJESZTESEK:
+            continue
+        fo.setdefault(tors, {})[ext] = nev
+        if "_" in tors:
+            extra.setdefault(tors.split("_", 1)[0], {}).setdefault(ext, []).append(nev)
+
+    d = Path(dir_str)
+    index: dict[str, tuple[Path, ...]] = {}
+    for qnum in fo.keys() | extra.keys():
+        fo_q = fo.get(qnum, {})
+        extra_q = extra.get(qnum, {})
+        index[qnum] = tuple(
+            [d / fo_q[ext] for ext in _KEP_KITERJESZTESEK if ext in fo_q]
+            + [
+                d / nev
+                for ext in _KEP_KITERJESZTESEK
+                for nev in sorted(extra_q.get(ext, ()))
+            ]
+        )
+    return MappingProxyType(index)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def kep_bajtok(path: str, mtime_ns: int, max_szelesseg: int = 1200) -> bytes:
+    """
+    A kép bájtjai rerunok között cache-ből (a kulcsban az mtime, így csere után újraolvas).
+    A max_szelesseg-nél szélesebb képet egyszer, az eredeti formátumban kicsinyítjük.
+    """
+    adat = Path(path).read_bytes()
+    with PILImage.open(io.BytesIO(adat)) as img:
+        if img.width <= max_szelesseg:
+            return adat
+        formatum = img.format
+        img.thumbnail((max_szelesseg, img.height))  # csak a szélességet korlátozzuk
+        buf = io.BytesIO()
+        img.save(buf, format=formatum)
+    return buf.getvalue()
 
 
 def find_question_images(qnum: str) -> list[Path]:
-    images: list[Path] = []
-    for ext in (".png", ".jpg", ".jpeg"):
-        p_main = PIC_DIR / f"{qnum}{ext}"
-        if p_main.exists():
-            images.append(p_main)
+    # Rerunonként csak a könyvtár stat-ja; a fájlok létezése a cache-elt indexből jön
+    return list(_kep_index(*_dir_key(PIC_DIR)).get(qnum, ()))
+
+
+def itelet_beallit(kerdes: str, uj: str | None) -> None:
+    # Ítélet beírása; a számlálók csak a változás irányában lépnek (nincs teljes újraszámolás)
+    regi = st.session_state.itel.get(kerdes)
+    if regi == uj:
+        return
+    st.session_state.itel[kerdes] = uj
+    st.session_state.itelt_db += (uj is not None) - (regi is not None)
+    st.session_state.helyes_db += (uj == "helyes") - (regi == "helyes")
+
+
+def export_reszletek(
+    kerdesek: Sequence[str], qa: Mapping[str, Sequence[str]], itel: Mapping[str, object]
+) -> tuple[dict, ...]:
+    # Egyetlen tuple, amit a szerializáló (orjson / json) közvetlenül listaként ír ki
+    return tuple(
+        {"kerdes": k, "elfogadhato_valaszok": qa.get(k, ()), "itel": itel.get(k)}
+        for k in kerdesek
+    )
 
-    for pattern in (f"{qnum}_*.png", f"{qnum}_*.jpg", f"{qnum}_*.jpeg"):
-        images.extend(sorted(PIC_DIR.glob(pattern), key=lambda p: p.name))
-    return images
+
+def export_json_bytes(export: dict) -> bytes:
+    if orjson is not None:
+        # orjson: C-ben szerializál, és eleve UTF-8 bájtokat ad vissza
+        return orjson.dumps(export, option=orjson.OPT_INDENT_2)
+    # json.dump közvetlenül bájt-pufferbe ír: nincs külön teljes str + bytes másolat
+    buf = io.BytesIO()
+    szoveg = io.TextIOWrapper(buf, encoding="utf-8", write_through=True)
+    json.dump(export, szoveg, ensure_ascii=False, indent=2)
+    szoveg.detach()  # a wrapper ne zárja be a puffert
+    return buf.getvalue()
 
 
 # ─────────────────────────────────────────────────────────
-# Cache-elt betöltés
-@st.cache_data(show_spinner=False)
-def betolt_qa(path: Path):
+# Cache-elt betöltés: egyetlen, session-ök között megosztott (csak olvasható) példány,
+# így cache-találatkor nincs hash-elés / pickle; a kulcs az útvonal és az mtime,
+# így a CSV módosítása után újratölt (a régi változat kiesik a max_entries miatt)
+def csv_verzio(p: Path) -> int:
+    try:
+        return p.stat().st_mtime_ns
+    except OSError:
+        return 0  # hiányzó fájl: a betolt_qa adja a saját hibaüzenetét
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def betolt_qa(path: str, mtime_ns: int) -> Mapping[str, tuple[str, ...]]:
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"Nem található a fájl: {p.resolve()}")
-    return beolvas_csv_dict(str(p))
+    return MappingProxyType(qa_tuple_ertekekkel(beolvas_csv_dict(str(p))))
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def betolt_kulcsok(path: str, mtime_ns: int) -> tuple[str, ...]:
+    # A kérdéslista egyszer készül el; az "Új kör" ebből mintavételez másolás nélkül
+    return tuple(betolt_qa(path, mtime_ns))
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def betolt_qa_md(path: str, mtime_ns: int) -> Mapping[str, str]:
+    # Betöltéskor egyszer előrenderelt válasz-markdown minden kérdéshez (session-ök között közös)
+    qa = betolt_qa(path, mtime_ns)
+    return MappingProxyType({k: answers_md_epit(v) for k, v in qa.items()})
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def betolt_feltoltott(adat: bytes) -> dict[str, tuple[str, ...]]:
+    # Feltöltött CSV közvetlenül a bájtokból (nincs ideiglenes fájl); a tartalom a cache-kulcs,
+    # így ugyanannak a feltöltésnek a rerunjai nem parse-olnak újra
+    return qa_tuple_ertekekkel(beolvas_csv_szovegbol(adat.decode("utf-8-sig")))
+
+
+def qa_tuple_ertekekkel(qa: Mapping[str, List[str]]) -> dict[str, tuple[str, ...]]:
+    # Csak olvasott válaszlisták → tuple: kisebb, hash-elhető (cache-kulcsnak is jó)
+    return {k: tuple(v) for k, v in qa.items()}
 
 
 def run_app():
@@ -162,13 +304,16 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
     # CSV betöltés (feltöltés esetén a saját parserrel)
     try:
         if feltoltott is not None:
-            tmp_path = Path(tempfile.gettempdir()) / "uploaded.csv"
-            with open(tmp_path, "wb") as f:
-                f.write(feltoltott.read())
-            qa = beolvas_csv_dict(str(tmp_path))
+            # getvalue(): a teljes tartalom, a fájlmutató állásától függetlenül (rerunkor is)
+            qa = betolt_feltoltott(feltoltott.getvalue())
+            kulcsok = None
+            qa_md = None  # feltöltésnél kérdésenként, megjelenítéskor renderelünk
             st.sidebar.success("Feltöltött CSV betöltve.")
         else:
-            qa = betolt_qa(CSV_FAJL)
+            verzio = csv_verzio(CSV_FAJL)
+            qa = betolt_qa(str(CSV_FAJL), verzio)
+            kulcsok = betolt_kulcsok(str(CSV_FAJL), verzio)
+            qa_md = betolt_qa_md(str(CSV_FAJL), verzio)
             st.sidebar.success(f"Betöltve: {Path(CSV_FAJL).name}")
     except FileNotFoundError as e:
         st.sidebar.error(str(e))
@@ -194,19 +339,37 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
     if "osszegzes" not in st.session_state:
         st.session_state.osszegzes = None
 
+    # Az itel-hez tartozó futó számlálók (ítélet-váltáskor frissülnek)
+    if "helyes_db" not in st.session_state:
+        st.session_state.helyes_db = 0
+
+    if "itelt_db" not in st.session_state:
+        st.session_state.itelt_db = 0
+
+    # Kérdésenként egyszer előállított válasz-markdown (a körrel együtt ürül)
+    if "rendered_md" not in st.session_state:
+        st.session_state.rendered_md = {}
+
     # ─────────────────────────────────────────────────────
     # Műveletek
     def uj_kor():
-        st.session_state.kor_kerdesei = valassz_kerdeseket(qa, KERDES_SZAM_KOR)
-        st.session_state.show_answer = {k: False for k in st.session_state.kor_kerdesei}
-        st.session_state.itel = {k: None for k in st.session_state.kor_kerdesei}
+        kor = valassz_kerdeseket(qa, KERDES_SZAM_KOR, kulcsok)
+        st.session_state.kor_kerdesei = kor
+        st.session_state.show_answer = dict.fromkeys(kor, False)
+        st.session_state.itel = dict.fromkeys(kor, None)
+        st.session_state.helyes_db = 0
+        st.session_state.itelt_db = 0
         st.session_state.osszegzes = None
+        st.session_state.rendered_md = {}
 
     def reset_minden():
         st.session_state.kor_kerdesei = []
         st.session_state.show_answer = {}
         st.session_state.itel = {}
+        st.session_state.helyes_db = 0
+        st.session_state.itelt_db = 0
         st.session_state.osszegzes = None
+        st.session_state.rendered_md = {}
 
     def mutasd_valaszt(kerdes: str):
         st.session_state.show_answer[kerdes] = True
@@ -241,24 +404,20 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
 
     st.subheader("Kérdések egy körben")
 
-    helyes_db = sum(
-        1
-        for k in st.session_state.kor_kerdesei
-        if st.session_state.itel.get(k) == "helyes"
-    )
-    itelt_db = sum(
-        1
-        for k in st.session_state.kor_kerdesei
-        if st.session_state.itel.get(k) in ("helyes", "hibas")
-    )
+    # A session_state proxy helyett helyi hivatkozások (ugyanazok a dictek)
+    kerdesek = st.session_state.kor_kerdesei
+    itel = st.session_state.itel
 
-    st.caption(
-        f"Önértékelt kérdések: {itelt_db} / {len(st.session_state.kor_kerdesei)} — "
-        f"Helyesnek ítélt: {helyes_db}"
-    )
+    # A haladás-felirat helye; a ciklus után töltjük ki, amikor a számlálók már frissek
+    halado_felirat = st.empty()
+
+    def kerdes_blokk(i: int, kerdes: str) -> None:
+        show = st.session_state.show_answer
+        itel = st.session_state.itel
+        rendered_md = st.session_state.rendered_md
 
-    for i, kerdes in enumerate(st.session_state.kor_kerdesei, start=1):
-        st.markdown(f"**{i}.** {kerdes}")
+        # Az elválasztó vonal és a kérdés szövege egyetlen markdown-elem
+        st.markdown(f"---\n\n**{i}.** {kerdes}" if i > 1 else f"**{i}.** {kerdes}")
 
         cols = st.columns([1, 2])
         with cols[0]:
@@ -271,9 +430,16 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
             )
 
         with cols[1]:
-            if st.session_state.show_answer.get(kerdes, False):
+            if show.get(kerdes, False):
                 st.success("Elfogadható válasz(ok):")
-                st.markdown(answers_bulleted_md(qa.get(kerdes, [])))
+                if qa_md is not None:
+                    md = qa_md.get(kerdes, "")
+                else:
+                    md = rendered_md.get(kerdes)
+                    if md is None:
+                        md = answers_bulleted_md(qa.get(kerdes, ()))
+                        rendered_md[kerdes] = md
+                st.markdown(md)
 
                 qnum = extract_qnum(kerdes)
                 if qnum:
@@ -284,7 +450,7 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
                         )
                         for idx_img, img_path in enumerate(imgs, start=1):
                             st.image(
-                                str(img_path),
+                                kep_bajtok(str(img_path), img_path.stat().st_mtime_ns),
                                 caption=(
                                     f"Ábra #{qnum}"
                                     if idx_img == 1
@@ -293,7 +459,7 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
                                 use_container_width=True,
                             )
 
-                current = st.session_state.itel.get(kerdes)
+                current = itel.get(kerdes)
                 radio_index = 0 if (current is None or current == "helyes") else 1
                 valasztas = st.radio(
                     "Önértékelés:",
@@ -302,22 +468,26 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
                     key=f"radio_{i}",
                     horizontal=True,
                 )
-                st.session_state.itel[kerdes] = (
-                    "helyes" if valasztas == "Helyesnek ítélem" else "hibas"
+                itelet_beallit(
+                    kerdes, "helyes" if valasztas == "Helyesnek ítélem" else "hibas"
                 )
             else:
                 st.info(
                     "Kattints a „Válasz megjelenítése” gombra, és utána értékeld a válaszodat."
                 )
 
-        st.write("---")
+    for i, kerdes in enumerate(kerdesek, start=1):
+        kerdes_blokk(i, kerdes)
+
+    helyes_db = st.session_state.helyes_db
+    halado_felirat.caption(
+        f"Önértékelt kérdések: {st.session_state.itelt_db} / {len(kerdesek)} — "
+        f"Helyesnek ítélt: {helyes_db}"
+    )
+
+    st.write("---")
 
     if st.button("🏁 Teszt kiértékelése", type="primary", key="btn_evaluate_test"):
-        helyes_db = sum(
-            1
-            for k in st.session_state.kor_kerdesei
-            if st.session_state.itel.get(k) == "helyes"
-        )
         sikeres = helyes_db >= KUSZOB
         st.session_state.osszegzes = {"helyes_db": helyes_db, "sikeres": sikeres}
 
@@ -326,33 +496,26 @@ Dir APP_DIR: {', '.join(p.name for p in APP_DIR.iterdir())}"""
         sikeres = st.session_state.osszegzes["sikeres"]
         if sikeres:
             st.success(
-                f"✅ SIKERES TESZT — GRATULÁLUNK! {helyes_db} / {len(st.session_state.kor_kerdesei)} "
+                f"✅ SIKERES TESZT — GRATULÁLUNK! {helyes_db} / {len(kerdesek)} "
                 f"(küszöb: {KUSZOB})"
             )
         else:
             st.error(
-                f"❌ SIKERTELEN TESZT — NO WORRIES {helyes_db} / {len(st.session_state.kor_kerdesei)} "
+                f"❌ SIKERTELEN TESZT — NO WORRIES {helyes_db} / {len(kerdesek)} "
                 f"(legalább {KUSZOB} szükséges)"
             )
 
         export = {
-            "kor_id": datetime.utcnow().isoformat() + "Z",
-            "kerdesek_szama": len(st.session_state.kor_kerdesei),
+            "kor_id": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "kerdesek_szama": len(kerdesek),
             "kuszob": KUSZOB,
             "helyes_db": helyes_db,
             "sikeres": sikeres,
-            "reszletek": [
-                {
-                    "kerdes": k,
-                    "elfogadhato_valaszok": qa.get(k, []),
-                    "itel": st.session_state.itel.get(k),
-                }
-                for k in st.session_state.kor_kerdesei
-            ],
+            "reszletek": export_reszletek(kerdesek, qa, itel),
         }
         st.download_button(
             label="📥 Eredmények letöltése (JSON)",
-            data=json.dumps(export, ensure_ascii=False, indent=2).encode("utf-8"),
+            data=export_json_bytes(export),
             file_name="kviz_eredmeny_onertekeles.json",
             mime="application/json",
             use_container_width=True,
@@ -1,33 +1,50 @@
 from __future__ import annotations
 
 import csv
+import functools
+import io
+import random
 import re
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
-QUESTION_HEADER_RE = re.compile(r"(?m)^\s*(\d+)\.\s+(?P<q>.+?)!\s*$")
+QUESTION_LINE_RE = re.compile(r"^\s*\d+\.\s+.+!\s*$")
+BULLET_MULTI_RE = re.compile(r"(?m)^\s*-\s+")
+QNUM_RE = re.compile(r"^\s*(\d+)\.")
+
+
+def _bullet_tartalom(ln: str) -> Optional[str]:
+    """Sor eleji '- ' bullet tartalma, vagy None (regex nélkül: '^\\s*-\\s+(.*)')."""
+    s = ln.lstrip()
+    if s[:1] == "-" and s[1:2].isspace():
+        return s[1:].lstrip()
+    return None
 
 
 def _answers_from_cell(cell: Optional[str]) -> List[str]:
     if cell is None:
         return []
-    txt = cell.replace("\r\n", "\n").replace("\r", "\n").strip()
+    # newline="" miatt a CSV cellában maradhat \r; csak akkor normalizálunk, ha van
+    if "\r" in cell:
+        cell = cell.replace("\r\n", "\n").replace("\r", "\n")
+    txt = cell.strip()
     if not txt:
         return []
 
-    if re.search(r"(?m)^\s*-\s+", txt):
+    # Olcsó előszűrés: kötőjel nélkül nincs bullet, a regex el is maradhat
+    if "-" in txt and BULLET_MULTI_RE.search(txt):
         lines = txt.splitlines()
         answers: List[str] = []
         current: List[str] = []
         in_bullet = False
         for ln in lines:
-            m = re.match(r"^\s*-\s+(.*)", ln)
-            if m:
+            tartalom = _bullet_tartalom(ln)
+            if tartalom is not None:
                 if current:
                     answers.append("\n".join(current).rstrip())
                     current = []
                 in_bullet = True
-                current.append(m.group(1))
+                current.append(tartalom)
             else:
                 if in_bullet:
                     current.append(ln.rstrip())
@@ -38,26 +55,70 @@ def _answers_from_cell(cell: Optional[str]) -> List[str]:
     return [txt]
 
 
-def _parse_numbered_text_strict(text: str) -> Dict[str, List[str]]:
-    matches = list(QUESTION_HEADER_RE.finditer(text))
-    if not matches:
-        return {}
+def _numbered_fejlecek(text: str) -> Iterator[Tuple[int, int, str]]:
+    """
+    'N. kérdés!' fejlécsorok soronkénti bejárással (regex nélkül), a korábbi
+    '(?m)^\\s*(\\d+)\\.\\s+(?P<q>.+?)!\\s*$' minta szerint; ha a pont után a sor
+    üres, a kérdés a következő nem üres sorban van.
+    Elemek: (fejléc eleje, a válaszblokk eleje, kérdés '!'-lel).
+    """
+    lines = text.split("\n")
+    n = len(lines)
+    i = pos = 0
+    while i < n:
+        line = lines[i]
+        kezdet = pos
+        pos += len(line) + 1
+        i += 1
+        s = line.lstrip()
+        if not s[:1].isdecimal():
+            continue
+        j = 1
+        while j < len(s) and s[j].isdecimal():
+            j += 1
+        if s[j : j + 1] != ".":
+            continue
+        r = s[j + 1 :].rstrip()
+        if r:
+            # pont után legalább egy szóköz, nem üres kérdés, a sor végén '!'
+            if len(r) >= 3 and r[0].isspace() and r[-1] == "!":
+                yield kezdet, pos, r[1:-1].strip() + "!"
+            continue
+        # a pont után üres a sor: a kérdés a következő nem üres sor
+        k, p = i, pos
+        while k < n and not lines[k].strip():
+            p += len(lines[k]) + 1
+            k += 1
+        if k == n:
+            continue
+        c = lines[k].rstrip()
+        if c[-1] == "!" and (len(c.lstrip()) >= 2 or c[0].isspace()):
+            i, pos = k + 1, p + len(lines[k]) + 1
+            yield kezdet, pos, c[:-1].strip() + "!"
+
 
+def _parse_numbered_text_strict(text: str) -> Dict[str, List[str]]:
     qa: Dict[str, List[str]] = {}
-    for i, m in enumerate(matches):
-        question_line = m.group("q").strip() + "!"
-        start = m.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        block = text[start:end]
-        if re.search(r"(?m)^\s*-\s+", block):
-            answers = _answers_from_cell(block)
-        else:
-            raw = block.strip()
-            answers = [raw] if raw else []
-        qa[question_line] = answers
+    # Egy fejléccel előre olvasunk: a blokk az előző fejléc végétől a következő elejéig tart
+    elozo = None
+    for fejlec in _numbered_fejlecek(text):
+        if elozo is not None:
+            _numbered_blokk(qa, elozo[2], text[elozo[1] : fejlec[0]])
+        elozo = fejlec
+    if elozo is not None:
+        _numbered_blokk(qa, elozo[2], text[elozo[1] :])
     return qa
 
 
+def _numbered_blokk(qa: Dict[str, List[str]], question_line: str, block: str) -> None:
+    if "-" in block and BULLET_MULTI_RE.search(block):
+        answers = _answers_from_cell(block)
+    else:
+        raw = block.strip()
+        answers = [raw] if raw else []
+    qa[question_line] = answers
+
+
 def _parse_row_q_and_as(row: List[str]) -> Optional[Tuple[str, List[str]]]:
     if not row or all(not (c and c.strip()) for c in row):
         return None
@@ -76,7 +137,7 @@ def _parse_row_q_and_as(row: List[str]) -> Optional[Tuple[str, List[str]]]:
 
     q_part, after_bang = first_cell.split("!", 1)
     question_line = (q_part.strip() + "!").strip()
-    if not re.match(r"^\s*\d+\.\s+.+!\s*$", question_line):
+    if not QUESTION_LINE_RE.match(question_line):
         return None
 
     after_bang = after_bang.lstrip()
@@ -94,65 +155,69 @@ def _parse_row_q_and_as(row: List[str]) -> Optional[Tuple[str, List[str]]]:
     answer_text = " ".join(parts).strip()
     answers = _answers_from_cell(answer_text)
 
-    seen = set()
-    uniq: List[str] = []
-    for ans in answers:
-        key = ans.strip().lower()
-        if key and key not in seen:
-            seen.add(key)
-            uniq.append(ans.strip())
+    egyedi: Dict[str, str] = {}
+    _egyedi_valaszok(egyedi, answers)
 
-    return (question_line, uniq)
+    return (question_line, list(egyedi.values()))
 
 
-def beolvas_csv_dict(filename: str) -> Dict[str, List[str]]:
-    path = Path(filename)
-    if not path.exists():
-        raise FileNotFoundError(f"Nem található a fájl: {path.resolve()}")
+def _egyedi_valaszok(cel: Dict[str, str], valaszok: Sequence[str]) -> None:
+    """A kisbetűs, levágott alak szerint új válaszokat fűz a ``cel`` dicthez (az első írásmód marad)."""
+    for ans in valaszok:
+        a = ans.strip()
+        key = a.lower()
+        if key:
+            cel.setdefault(key, a)
+
 
+def _beolvas_csv_nyers(path: Path) -> Dict[str, List[str]]:
+    # Egyetlen olvasás: a CSV-parser és a szöveges fallback is ugyanebből a szövegből dolgozik
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return beolvas_csv_szovegbol(f.read())
+
+
+def beolvas_csv_szovegbol(nyers: str) -> Dict[str, List[str]]:
+    """
+    Ugyanaz a feldolgozás, mint beolvas_csv_dict-nél, de már beolvasott szövegből
+    (pl. feltöltött fájl bájtjaiból, ideiglenes fájl nélkül). Nincs cache.
+    """
+    qa: Dict[str, List[str]] = {}
+    # duplikált kérdésekhez: normalizált kulcs -> első írásmód, beillesztési sorrendben
+    osszevont: Dict[str, Dict[str, str]] = {}
+    any_row = False
     try:
-        with open(path, "r", encoding="utf-8-sig", newline="") as f:
-            reader = csv.reader(f, delimiter=",")
-            qa: Dict[str, List[str]] = {}
-            any_row = False
-
-            for row in reader:
-                any_row = True
-                parsed = _parse_row_q_and_as(row)
-                if not parsed:
-                    continue
-
-                question, answers = parsed
-                if question in qa:
-                    merged = qa[question] + answers
-                    seen = set()
-                    uniq: List[str] = []
-                    for ans in merged:
-                        key = ans.strip().lower()
-                        if key and key not in seen:
-                            seen.add(key)
-                            uniq.append(ans.strip())
-                    qa[question] = uniq
-                else:
-                    qa[question] = answers
+        for row in csv.reader(io.StringIO(nyers, newline=""), delimiter=","):
+            any_row = True
+            parsed = _parse_row_q_and_as(row)
+            if not parsed:
+                continue
+
+            question, answers = parsed
+            if question in qa:
+                egyedi = osszevont.get(question)
+                if egyedi is None:
+                    egyedi = osszevont[question] = {}
+                    _egyedi_valaszok(egyedi, qa[question])
+                _egyedi_valaszok(egyedi, answers)
+            else:
+                qa[question] = answers
+        for question, egyedi in osszevont.items():
+            qa[question] = list(egyedi.values())
 
     except csv.Error:
-        text = path.read_text(encoding="utf-8-sig")
-        qa_fb = _parse_numbered_text_strict(text)
+        qa_fb = _parse_numbered_text_strict(_sorvegek_egyesitve(nyers))
         if qa_fb:
             return qa_fb
         raise
 
     if any_row and not qa:
-        text = path.read_text(encoding="utf-8-sig")
-        qa_fb = _parse_numbered_text_strict(text)
+        qa_fb = _parse_numbered_text_strict(_sorvegek_egyesitve(nyers))
         if qa_fb:
             return qa_fb
         raise ValueError("Nem sikerült kérdés–válasz párokat beolvasni.")
 
     if not any_row:
-        text = path.read_text(encoding="utf-8-sig")
-        qa_fb = _parse_numbered_text_strict(text)
+        qa_fb = _parse_numbered_text_strict(_sorvegek_egyesitve(nyers))
         if qa_fb:
             return qa_fb
         raise ValueError("A CSV üresnek tűnik.")
@@ -160,11 +225,51 @@ def beolvas_csv_dict(filename: str) -> Dict[str, List[str]]:
     return qa
 
 
-def valassz_kerdeseket(qa: Dict[str, List[str]], n: int = 10) -> List[str]:
-    import random
+def _sorvegek_egyesitve(nyers: str) -> str:
+    """\r\n és \r -> \n, ahogy a szöveges módú olvasás (read_text) adná a fallback-nek."""
+    if "\r" not in nyers:
+        return nyers
+    return nyers.replace("\r\n", "\n").replace("\r", "\n")
+
+
+# --- Beolvasott Q&A gyorsítótár (folyamaton belül, lru_cache) ---
+# A kulcs a fájl mtime-ja és mérete, így a CSV módosításakor automatikusan újraolvasunk.
+
+
+@functools.lru_cache(maxsize=4)
+def _beolvas_cachelt(filename: str, mtime_ns: int, size: int) -> Dict[str, List[str]]:
+    return _beolvas_csv_nyers(Path(filename))
+
+
+def beolvas_csv_dict(filename: str) -> Dict[str, List[str]]:
+    """
+    Beolvasás a kémia Q&A CSV-ből ('N. kérdés!' + válasz cellák), hibás CSV
+    esetén számozott szöveges fallback-kel. A beolvasott eredmény cache-elődik.
+    """
+    path = Path(filename)
+    if not path.exists():
+        raise FileNotFoundError(f"Nem található a fájl: {path.resolve()}")
+    st = path.stat()
+    qa = _beolvas_cachelt(str(path.resolve()), st.st_mtime_ns, st.st_size)
+    # Friss másolat: a hívó módosíthatja anélkül, hogy a cache-t elrontaná
+    return {q: list(a) for q, a in qa.items()}
+
+
+# Az app fő szkriptje minden rerunnál újrafut, ezért a cache itt, az importált modulban él
+@functools.lru_cache(maxsize=2048)
+def extract_qnum(kerdes: str) -> Optional[str]:
+    """A kérdés elején álló sorszám ('12. ...' -> '12'), vagy None."""
+    m = QNUM_RE.match(kerdes)
+    return m.group(1) if m else None
+
 
+def valassz_kerdeseket(
+    qa: Dict[str, List[str]], n: int = 10, kulcsok: Sequence[str] | None = None
+) -> List[str]:
+    """kulcsok: előre elkészített kérdéslista (különben qa kulcsaiból épül)."""
     if n > len(qa):
         raise ValueError(
             "Nagyobb számot adtál meg, mint ahány kérdés rendelkezésre áll."
         )
-    return random.sample(list(qa.keys()), n)
+    pool = kulcsok if kulcsok is not None else list(qa.keys())
+    return random.sample(pool, n)
@@ -2,7 +2,12 @@ import streamlit as st
 import requests
 import pandas as pd
 import plotly.express as px
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import sqlite3
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Page config
@@ -31,44 +36,244 @@ st.markdown(
 # API key from secrets
 api_key = st.secrets["openweathermap"]["api_key"]
 
-# SQLite setup
-conn = sqlite3.connect("weather_logs.db")
-cursor = conn.cursor()
-cursor.execute(
-    """
+
+# SQLite setup: one connection per process, shared by every session and rerun.
+# WAL lets the logs query read while a search is being logged; NORMAL sync is
+# durable enough for a search log and avoids an fsync on every commit.
+@st.cache_resource
+def get_conn():
+    conn = sqlite3.connect("weather_logs.db", check_same_thread=False)
+    conn.executescript(
+        """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout=5000;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-20000;
 CREATE TABLE IF NOT EXISTS searches (
     city TEXT,
     temperature REAL,
     humidity INTEGER,
     wind_speed REAL,
-    timestamp TEXT
-)
+    timestamp INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_searches_city_ts ON searches(city, timestamp DESC);
 """
+    )
+    # Older databases stored local-time 'YYYY-MM-DD HH:MM:SS' strings; convert them to epoch seconds
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(searches)")}
+    if columns["timestamp"].upper() == "TEXT":
+        conn.executescript(
+            """
+BEGIN;
+ALTER TABLE searches RENAME TO searches_old;
+DROP INDEX idx_searches_city_ts;
+CREATE TABLE searches (
+    city TEXT,
+    temperature REAL,
+    humidity INTEGER,
+    wind_speed REAL,
+    timestamp INTEGER
+);
+INSERT INTO searches
+SELECT city, temperature, humidity, wind_speed,
+       CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+FROM searches_old;
+DROP TABLE searches_old;
+CREATE INDEX idx_searches_city_ts ON searches(city, timestamp DESC);
+COMMIT;
+"""
+        )
+    return conn
+
+
+# Sessions run in separate threads, so writes on the shared connection are serialized
+@st.cache_resource
+def get_db_lock():
+    return threading.Lock()
+
+
+# Search logs are buffered and written in one transaction per batch instead of
+# one commit per search; whatever is left is flushed when the process exits.
+LOG_BATCH_SIZE = 8
+# One SQL text for every flush, so sqlite3's statement cache keeps it prepared
+INSERT_SQL = (
+    "INSERT INTO searches (city, temperature, humidity, wind_speed, timestamp)"
+    " VALUES (?, ?, ?, ?, ?)"
 )
-conn.commit()
 
 
-# Cached functions
-@st.cache_data(ttl=600)
+# Bumped on every flush; the cached logs query is keyed on it
+@st.cache_resource
+def get_logs_version():
+    return {"version": 0}
+
+
+def flush_logs(conn, lock, pending, state):
+    with lock:
+        if pending:
+            with conn:
+                conn.executemany(INSERT_SQL, pending)
+            pending.clear()
+            state["version"] += 1
+
+
+@st.cache_resource
+def get_log_buffer():
+    pending = []
+    atexit.register(flush_logs, get_conn(), get_db_lock(), pending, get_logs_version())
+    return pending
+
+
+def log_search(row):
+    pending = get_log_buffer()
+    lock = get_db_lock()
+    with lock:
+        pending.append(row)
+        if len(pending) < LOG_BATCH_SIZE:
+            return
+    flush_logs(conn, lock, pending, get_logs_version())
+
+
+@st.cache_data(ttl=60, max_entries=64)
+def load_logs(city, limit, version):
+    # Most recent searches for this city; served from idx_searches_city_ts
+    return pd.read_sql_query(
+        "SELECT city, temperature, humidity, wind_speed, timestamp FROM searches"
+        " WHERE city = ? ORDER BY timestamp DESC LIMIT ?",
+        get_conn(),
+        params=(city, limit),
+    )
+
+
+conn = get_conn()
+
+
+# One keep-alive session for both endpoints, so cache misses reuse the pooled connection
+@st.cache_resource
+def get_http():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# ETag / Last-Modified validators per URL with the last payload, so a refetch
+# after TTL expiry can be answered with 304 Not Modified
+ETAG_STORE_SIZE = 256
+
+
+@st.cache_resource
+def get_etag_store():
+    return {}
+
+
+def get_json(url):
+    store = get_etag_store()
+    cached = store.get(url)
+    headers = {}
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    resp = get_http().get(url, headers=headers, timeout=5)
+    if resp.status_code == 304 and cached:
+        return cached[2]
+    payload = resp.json()
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if resp.status_code == 200 and (etag or last_modified):
+        store.pop(url, None)
+        if len(store) >= ETAG_STORE_SIZE:
+            store.pop(next(iter(store)), None)
+        store[url] = (etag, last_modified, payload)
+    return payload
+
+
+# Cached functions; city is passed normalised (city_key below) so case and
+# stray whitespace don't cause extra misses. Forecasts only update every 3 h.
+@st.cache_data(ttl=1800)
 def get_current_weather(city):
     url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-    return requests.get(url).json()
+    return get_json(url)
 
 
-@st.cache_data(ttl=3600)
+@st.cache_data(ttl=21600)
 def get_forecast(city):
     url = f"http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={api_key}&units=metric"
-    return requests.get(url).json()
+    return get_json(url)
+
+
+# Cached DataFrame, so warm reruns skip rebuilding it from the forecast JSON
+@st.cache_data(ttl=21600)
+def get_forecast_df(city):
+    forecast_data = get_forecast(city)
+    if forecast_data.get("cod") != "200":
+        return None
+    df = pd.json_normalize(forecast_data["list"])[
+        ["dt_txt", "main.temp", "main.humidity"]
+    ].rename(
+        columns={"dt_txt": "datetime", "main.temp": "temp", "main.humidity": "humidity"}
+    )
+    # Parsed once here rather than by Plotly on every chart
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    return df.astype({"temp": "float32", "humidity": "int16"})
+
+
+@st.cache_data(ttl=21600)
+def build_forecast_figs(city):
+    df = get_forecast_df(city)
+    fig_temp = px.line(
+        df,
+        x="datetime",
+        y="temp",
+        title="Temperature Forecast",
+        markers=True,
+        color_discrete_sequence=["#FF5733"],
+    )
+    fig_hum = px.line(
+        df,
+        x="datetime",
+        y="humidity",
+        title="Humidity Forecast",
+        markers=True,
+        color_discrete_sequence=["#1f77b4"],
+    )
+    return fig_temp, fig_hum
+
+
+# The two endpoints are independent, so on a cold cache they are fetched concurrently
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def fetch_weather(city):
+    ctx = get_script_run_ctx()
+
+    def run(fn):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(city)
+
+    executor = get_executor()
+    f_cur = executor.submit(run, get_current_weather)
+    f_fc = executor.submit(run, get_forecast_df)
+    return f_cur.result(), f_fc.result()
 
 
 # Sidebar input
 st.sidebar.title("Weather Settings")
 city = st.sidebar.text_input("Enter city name", "Marrakesh")
+logs_limit = st.sidebar.number_input("Show last N searches", 50, 5000, 200, step=50)
 
 st.title("🌤 Weather Dashboard")
 
 if city:
-    weather_data = get_current_weather(city)
+    city_key = city.strip().lower()
+    weather_data, df = fetch_weather(city_key)
     if weather_data.get("cod") == 200:
         temp = weather_data["main"]["temp"]
         humidity = weather_data["main"]["humidity"]
@@ -78,17 +283,15 @@ if city:
         lon = weather_data["coord"]["lon"]
 
         # Log search
-        cursor.execute(
-            "INSERT INTO searches VALUES (?, ?, ?, ?, ?)",
+        log_search(
             (
                 city,
                 temp,
                 humidity,
                 wind_speed,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            ),
+                int(time.time()),
+            )
         )
-        conn.commit()
 
         # KPI cards
         col1, col2, col3 = st.columns(3)
@@ -116,47 +319,39 @@ if city:
 
         # Tabs
         tab1, tab2, tab3 = st.tabs(["Forecast", "Raw Data", "Search Logs"])
-        forecast_data = get_forecast(city)
-        if forecast_data.get("cod") == "200":
-            df = pd.DataFrame(
-                [
-                    {
-                        "datetime": item["dt_txt"],
-                        "temp": item["main"]["temp"],
-                        "humidity": item["main"]["humidity"],
-                    }
-                    for item in forecast_data["list"]
-                ]
-            )
-
+        if df is not None:
             with tab1:
                 st.subheader("📈 Temperature Forecast")
-                fig_temp = px.line(
-                    df,
-                    x="datetime",
-                    y="temp",
-                    title="Temperature Forecast",
-                    markers=True,
-                    color_discrete_sequence=["#FF5733"],
-                )
+                fig_temp, fig_hum = build_forecast_figs(city_key)
                 st.plotly_chart(fig_temp, use_container_width=True)
 
                 st.subheader("💧 Humidity Forecast")
-                fig_hum = px.line(
-                    df,
-                    x="datetime",
-                    y="humidity",
-                    title="Humidity Forecast",
-                    markers=True,
-                    color_discrete_sequence=["#1f77b4"],
-                )
                 st.plotly_chart(fig_hum, use_container_width=True)
 
             with tab2:
                 st.dataframe(df)
 
         with tab3:
-            logs_df = pd.read_sql_query("SELECT * FROM searches", conn)
+            logs_df = load_logs(city, logs_limit, get_logs_version()["version"])
+            # Include searches that are still waiting in the buffer, newest first
+            with get_db_lock():
+                pending_rows = [row for row in get_log_buffer() if row[0] == city]
+            if pending_rows:
+                pending_df = pd.DataFrame(pending_rows[::-1], columns=logs_df.columns)
+                logs_df = (
+                    pd.concat([pending_df, logs_df], ignore_index=True).head(logs_limit)
+                    if len(logs_df)
+                    else pending_df.head(logs_limit)
+                )
+            # Narrower dtypes mean less data shipped to the browser
+            logs_df = logs_df.astype(
+                {"temperature": "float32", "humidity": "int16", "wind_speed": "float32"}
+            )
+            # Stored as epoch seconds; shown in the server's local time as before
+            # (fromtimestamp applies the zone's DST rules per row; a fixed offset would not)
+            logs_df["timestamp"] = pd.to_datetime(
+                logs_df["timestamp"].map(datetime.fromtimestamp)
+            )
             st.dataframe(logs_df)
     else:
         st.warning("City not found or API error.")